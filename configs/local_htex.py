@@ -1,4 +1,4 @@
-from parsl.executors import HighThroughputExecutor
+from parsl.executors import HighThroughputExecutor, ThreadPoolExecutor
 from parsl.launchers import SingleNodeLauncher
 from parsl.providers import LocalProvider
 from parsl.config import Config
@@ -20,12 +20,12 @@ def get_config(path_internal):
                 provider=provider,
                 max_workers=1,
                 ),
-            HighThroughputExecutor(
-                address='localhost',
+            ThreadPoolExecutor( # lightweight bookkeeping apps; no workers
+                # these run on the driver and share its dataset caches, which
+                # are bounded by psiflow.data._CACHE_MAX_ATOMS
                 label='default',
+                max_threads=4,
                 working_dir=str(path_internal / 'default_executor'),
-                provider=provider,
-                cores_per_worker=1,
                 ),
             HighThroughputExecutor(
                 address='localhost',
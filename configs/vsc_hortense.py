@@ -274,7 +274,7 @@ class SlurmProvider(ClusterProvider, RepresentationMixin):
 
 def get_config(path_internal):
     from parsl.config import Config
-    from parsl.executors import HighThroughputExecutor
+    from parsl.executors import HighThroughputExecutor, ThreadPoolExecutor
     channel = LocalChannel(script_dir=str(path_internal / 'local_script_dir'))
     worker_init = 'ml PLUMED/2.7.2-intel-2021a; ml psiflow-develop/10Jan2023-CPU'
     provider = SlurmProvider(
@@ -290,12 +290,12 @@ def get_config(path_internal):
             worker_init=worker_init,
             exclusive=False,
             )
-    default = HighThroughputExecutor(
+    default = ThreadPoolExecutor( # lightweight bookkeeping apps; no workers
+            # these run on the driver and share its dataset caches, which
+            # are bounded by psiflow.data._CACHE_MAX_ATOMS
             label='default',
-            provider=provider,
-            address=os.environ['HOSTNAME'],
+            max_threads=4,
             working_dir=str(path_internal / 'default_executor'),
-            cores_per_worker=1,
             )
     model = HighThroughputExecutor(
             label='model',
@@ -1,8 +1,11 @@
 from __future__ import annotations # necessary for type-guarding class methods
-from typing import Optional, Union, List
+from typing import Optional, Union, List, Dict, Tuple
 import typeguard
 import copy
 import os
+import hashlib
+import collections
+import threading
 import tempfile
 import logging
 import numpy as np
@@ -62,18 +65,19 @@ class FlowAtoms(Atoms):
         flow_atoms.arrays = {}
         for name, a in atoms.arrays.items():
             flow_atoms.arrays[name] = a.copy()
-        flow_atoms.constraints = copy.deepcopy(atoms.constraints)
+        if len(atoms.constraints) > 0: # deepcopy is expensive; avoid if possible
+            flow_atoms.constraints = copy.deepcopy(atoms.constraints)
         return flow_atoms
 
 
 @id_for_memo.register(FlowAtoms)
 def id_for_memo_flowatoms(atoms: FlowAtoms, output_ref=False):
     assert not output_ref
-    string = ''
-    string += str(atoms.numbers)
-    string += str(atoms.cell.round(decimals=4))
-    string += str(atoms.positions.round(decimals=4))
-    return bytes(string, 'utf-8')
+    h = hashlib.sha256() # hash raw bytes instead of formatting floats
+    h.update(np.ascontiguousarray(atoms.numbers, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(atoms.cell.array.round(decimals=4)).tobytes())
+    h.update(np.ascontiguousarray(atoms.positions.round(decimals=4)).tobytes())
+    return h.digest()
 
 
 @typeguard.typechecked
@@ -83,18 +87,178 @@ def parse_reference_logs(atoms_list: List[FlowAtoms]) -> str:
         log = atoms.reference_log
         if log is None:
             log = ''
-        lines = log.split('\n')
         prefix = 'INDEX {:05} - '.format(i)
-        for line in lines:
-            _all.append(prefix + line)
+        _all.append(prefix + log.replace('\n', '\n' + prefix)) # prefix all lines
         _all.append('\n\n')
     return '\n'.join(_all)
 
 
+def _path_cache(path_xyz) -> Path:
+    return Path(os.fspath(path_xyz) + '.npz') # binary sidecar of .xyz
+
+
+@typeguard.typechecked
+def dataset_to_arrays(data: List[Atoms]) -> Dict[str, np.ndarray]:
+    """Packs a list of states into contiguous (ragged) numpy arrays
+
+    Per-atom quantities are concatenated along the first axis; the number of
+    atoms in each state is stored in the 'natoms' array. Missing properties
+    are zero-filled and flagged in the corresponding 'has_*' arrays.
+    Stresses in Voigt form are converted to 3x3; stresses of any other shape
+    are treated as missing.
+
+    """
+    from ase.stress import voigt_6_to_full_3x3_stress
+    nstates = len(data)
+    natoms = np.array([len(atoms) for atoms in data], dtype=int)
+    arrays = {
+            'natoms': natoms,
+            'numbers': np.zeros(np.sum(natoms), dtype=int),
+            'positions': np.zeros((np.sum(natoms), 3)),
+            'forces': np.zeros((np.sum(natoms), 3)),
+            'cell': np.zeros((nstates, 3, 3)),
+            'energy': np.zeros(nstates),
+            'stress': np.zeros((nstates, 3, 3)),
+            'has_energy': np.zeros(nstates, dtype=bool),
+            'has_forces': np.zeros(nstates, dtype=bool),
+            'has_stress': np.zeros(nstates, dtype=bool),
+            'reference_status': np.zeros(nstates, dtype=bool),
+            }
+    start = 0
+    for i, atoms in enumerate(data):
+        stop = start + len(atoms)
+        arrays['numbers'][start:stop] = atoms.numbers
+        arrays['positions'][start:stop] = atoms.positions
+        arrays['cell'][i] = atoms.cell.array
+        arrays['reference_status'][i] = atoms.info.get('reference_status', False)
+        if 'energy' in atoms.info.keys():
+            arrays['energy'][i] = atoms.info['energy']
+            arrays['has_energy'][i] = True
+        if 'forces' in atoms.arrays.keys():
+            arrays['forces'][start:stop] = atoms.arrays['forces']
+            arrays['has_forces'][i] = True
+        if 'stress' in atoms.info.keys():
+            stress = np.asarray(atoms.info['stress'])
+            if stress.size == 9:
+                arrays['stress'][i] = stress.reshape((3, 3))
+                arrays['has_stress'][i] = True
+            elif stress.size == 6:
+                arrays['stress'][i] = voigt_6_to_full_3x3_stress(stress.reshape(6))
+                arrays['has_stress'][i] = True
+        start = stop
+    return arrays
+
+
+@typeguard.typechecked
+def save_dataset_arrays(path_xyz: Union[Path, str, File], data: List[Atoms]) -> None:
+    """Writes the binary sidecar of an .xyz file which was just written"""
+    write_dataset_cache(path_xyz, dataset_to_arrays(data))
+
+
+@typeguard.typechecked
+def write_dataset_cache(
+        path_xyz: Union[Path, str, File],
+        arrays: Dict[str, np.ndarray],
+        ) -> None:
+    path_cache = _path_cache(path_xyz)
+    arrays = dict(arrays, size_xyz=np.array(os.path.getsize(path_xyz)))
+    with open(path_cache, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+@typeguard.typechecked
+def load_dataset_cache(path_xyz: Union[Path, str, File]) -> Optional[Dict[str, np.ndarray]]:
+    """Loads the binary sidecar of an .xyz file, or None if it is invalid
+
+    The sidecar is only valid if it is not older than the .xyz file and
+    if it was generated from an .xyz file of the same size.
+
+    """
+    path_cache = _path_cache(path_xyz)
+    if not path_cache.is_file():
+        return None
+    stat_xyz = os.stat(path_xyz)
+    if path_cache.stat().st_mtime_ns < stat_xyz.st_mtime_ns:
+        return None
+    with np.load(path_cache) as npz:
+        arrays = {key: npz[key] for key in npz.files}
+    if int(arrays.pop('size_xyz')) != stat_xyz.st_size:
+        return None
+    return arrays
+
+
+class _DatasetCache:
+    """Process-local LRU cache of parsed datasets, keyed by file identity
+
+    The cache is bounded by the total number of atoms in its entries rather
+    than by the number of entries, such that its memory footprint does not
+    depend on the size of the datasets. Datasets which are larger than the
+    budget by themselves are never cached.
+
+    """
+
+    def __init__(self, max_atoms):
+        self.max_atoms = max_atoms
+        self.natoms = 0
+        self._entries = collections.OrderedDict() # key: (value, natoms)
+        self._lock = threading.Lock() # threadpool apps share the process
+
+    def get(self, path_xyz, load, count_atoms):
+        stat = os.stat(path_xyz)
+        key = (os.fspath(path_xyz), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+        value = load(key[0]) # parsed without holding the lock
+        natoms = count_atoms(value)
+        with self._lock:
+            if (natoms <= self.max_atoms) and (key not in self._entries):
+                self._entries[key] = (value, natoms)
+                self.natoms += natoms
+                while self.natoms > self.max_atoms: # evict least recently used
+                    _, (_, _natoms) = self._entries.popitem(last=False)
+                    self.natoms -= _natoms
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.natoms = 0
+
+
+_CACHE_MAX_ATOMS = 100000 # per cache and per process
+
+
+def _load_dataset_arrays(path_xyz: str) -> Dict[str, np.ndarray]:
+    arrays = load_dataset_cache(path_xyz)
+    if arrays is None:
+        arrays = dataset_to_arrays(list(read_states(path_xyz)))
+    for array in arrays.values(): # shared between callers
+        array.flags.writeable = False
+    return arrays
+_arrays_cache = _DatasetCache(_CACHE_MAX_ATOMS)
+
+
+@typeguard.typechecked
+def load_dataset_arrays(path_xyz: Union[Path, str, File]) -> Dict[str, np.ndarray]:
+    """Loads the (read-only) arrays of a dataset, using a process-local cache
+
+    Arrays are obtained from the binary sidecar if it is valid, and from
+    the .xyz file otherwise.
+
+    """
+    return dict(_arrays_cache.get(
+        path_xyz,
+        _load_dataset_arrays,
+        lambda arrays: int(np.sum(arrays['natoms'])),
+        ))
+
+
 @typeguard.typechecked
 def save_dataset(
         states: Optional[List[Optional[FlowAtoms]]],
-        inputs: List[Optional[FlowAtoms]] = [], # allow None
+        inputs: List[Union[None, FlowAtoms, List[FlowAtoms]]] = [], # allow None
         return_data: bool = False, # whether to return data
         outputs: List[File] = [],
         ) -> Optional[List[FlowAtoms]]:
@@ -102,24 +266,59 @@ def save_dataset(
     if states is not None:
         _data = states
     else:
-        _data = inputs
-    i = 0
-    while i < len(_data):
-        if _data[i] is None:
-            del _data[i]
-        else:
-            i += 1
-    with open(outputs[0], 'w') as f:
+        _data = []
+        for item in inputs: # batched apps return lists of states
+            if isinstance(item, list):
+                _data.extend(item)
+            else:
+                _data.append(item)
+    _data = [atoms for atoms in _data if atoms is not None]
+    with open(outputs[0], 'w', buffering=1 << 20) as f:
         write_extxyz(f, _data)
+    save_dataset_arrays(outputs[0], _data)
     if return_data:
         return _data
 
 
 @typeguard.typechecked
-def _save_atoms(atoms: FlowAtoms, outputs=[]):
+def _save_states(inputs: List[FlowAtoms] = [], outputs: List[File] = []) -> None:
+    """Writes each state to the corresponding output, within a single app"""
     from ase.io import write
-    write(outputs[0].filepath, atoms)
-save_atoms = python_app(_save_atoms, executors=['default'])
+    assert len(inputs) == len(outputs)
+    for atoms, file in zip(inputs, outputs):
+        write(file.filepath, atoms)
+save_states = python_app(_save_states, executors=['default'])
+
+
+def _read_states(path_xyz: str) -> Tuple[Atoms, ...]:
+    from ase.io.extxyz import read_extxyz
+    with open(path_xyz, 'r') as f:
+        return tuple(read_extxyz(f, index=slice(None)))
+_states_cache = _DatasetCache(_CACHE_MAX_ATOMS)
+
+
+@typeguard.typechecked
+def read_states(path_xyz: Union[Path, str, File]) -> Tuple[Atoms, ...]:
+    """Parses all states in an .xyz file, using a process-local cache
+
+    Subsequent apps which run in the same worker process and read the same
+    (unmodified) file reuse the parsed states. These should not be modified;
+    use _copy_state to obtain an independent FlowAtoms instance.
+
+    """
+    return _states_cache.get(
+            path_xyz,
+            _read_states,
+            lambda states: sum(len(atoms) for atoms in states),
+            )
+
+
+def _copy_state(atoms: Atoms) -> FlowAtoms:
+    flow_atoms = FlowAtoms.from_atoms(atoms)
+    for key, value in flow_atoms.info.items(): # info is copied shallowly
+        if isinstance(value, np.ndarray):
+            flow_atoms.info[key] = value.copy()
+    return flow_atoms
 
 
 @typeguard.typechecked
@@ -127,39 +326,90 @@ def read_dataset(
         index_or_indices: Union[int, List[int], slice],
         inputs: List[File] = [],
         outputs: List[File] = [],
-        ) -> Union[FlowAtoms, List[FlowAtoms]]:
-    from ase.io.extxyz import read_extxyz, write_extxyz
-    from psiflow.data import FlowAtoms
-    with open(inputs[0], 'r' ) as f:
-        if type(index_or_indices) == int:
-            atoms = list(read_extxyz(f, index=index_or_indices))[0]
-            data  = FlowAtoms.from_atoms(atoms) # single atoms instance
-        else:
-            if type(index_or_indices) == list:
-                data = [list(read_extxyz(f, index=i))[0] for i in index_or_indices]
-            elif type(index_or_indices) == slice:
-                data = list(read_extxyz(f, index=index_or_indices))
-            else:
-                raise ValueError
-            data = [FlowAtoms.from_atoms(a) for a in data] # list of atoms
+        ) -> Optional[Union[FlowAtoms, List[FlowAtoms]]]:
+    """Reads one or more states, or writes them to outputs if present
+
+    When an output file is given, the selected states are written without
+    being copied into new FlowAtoms instances, and None is returned.
+
+    """
+    from ase.io.extxyz import write_extxyz
+    from psiflow.data import FlowAtoms, read_states, _copy_state
+    states = read_states(inputs[0]) # cached in this process
+    if type(index_or_indices) == int:
+        selection = [states[index_or_indices]]
+    elif type(index_or_indices) == list:
+        selection = [states[i] for i in index_or_indices]
+    elif type(index_or_indices) == slice:
+        selection = list(states[index_or_indices])
+    else:
+        raise ValueError
     if len(outputs) > 0: # save to file
-        with open(outputs[0], 'w') as f:
-            write_extxyz(f, data)
+        with open(outputs[0], 'w', buffering=1 << 20) as f:
+            write_extxyz(f, selection)
+        save_dataset_arrays(outputs[0], selection)
+        return None
+    data = [_copy_state(atoms) for atoms in selection]
+    if type(index_or_indices) == int:
+        return data[0] # single atoms instance
     return data
 
 
 @typeguard.typechecked
 def join_dataset(inputs: List[File] = [], outputs: List[File] = []) -> None:
-    data = []
-    for i in range(len(inputs)):
-        data += read_dataset(slice(None), inputs=[inputs[i]]) # read all
-    save_dataset(data, outputs=[outputs[0]])
+    import shutil
+    import numpy as np
+    from psiflow.data import load_dataset_cache, write_dataset_cache
+    caches = [load_dataset_cache(input_) for input_ in inputs]
+    with open(outputs[0], 'wb') as f_out: # states in .xyz are self-contained
+        for input_ in inputs:
+            with open(input_, 'rb') as f:
+                shutil.copyfileobj(f, f_out, length=1 << 20)
+                if f.tell() > 0: # ensure next state starts on a new line
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        f_out.write(b'\n')
+    if (len(caches) > 0) and all([cache is not None for cache in caches]):
+        arrays = {}
+        for key in caches[0].keys():
+            arrays[key] = np.concatenate([cache[key] for cache in caches])
+    else:
+        arrays = None
+    write_dataset_cache(outputs[0], arrays)
+
+
+@typeguard.typechecked
+def scan_states(path_xyz: Union[Path, str, File]) -> List[Tuple[int, str]]:
+    """Returns the byte offset and comment line of each state in an .xyz file
+
+    Only the header of each state is read; the per-atom lines are skipped
+    without being parsed.
+
+    """
+    from itertools import islice
+    states = []
+    with open(path_xyz, 'rb') as f:
+        while True:
+            offset = f.tell()
+            line = f.readline()
+            if not line: # end of file
+                break
+            if not line.strip(): # trailing whitespace
+                continue
+            natoms = int(line)
+            states.append((offset, f.readline().decode()))
+            for _ in islice(f, natoms):
+                pass
+    return states
 
 
 @typeguard.typechecked
 def get_length_dataset(inputs: List[File] = []) -> int:
-    data = read_dataset(slice(None), inputs=[inputs[0]])
-    return len(data)
+    from psiflow.data import load_dataset_cache, scan_states
+    arrays = load_dataset_cache(inputs[0])
+    if arrays is not None:
+        return len(arrays['natoms'])
+    return len(scan_states(inputs[0]))
 
 
 @typeguard.typechecked
@@ -167,13 +417,21 @@ def get_indices_per_flag(
         flag: bool,
         inputs: List[File] = [],
         ) -> List[int]:
-    data = read_dataset(slice(None), inputs=[inputs[0]])
-    indices = []
-    for i, atoms in enumerate(data):
-        assert atoms.reference_status is not None
-        if atoms.reference_status == flag:
-            indices.append(i)
-    return indices
+    import re
+    import numpy as np
+    from psiflow.data import load_dataset_cache, scan_states
+    arrays = load_dataset_cache(inputs[0])
+    if arrays is not None:
+        reference_status = arrays['reference_status']
+    else: # parse flag from comment lines; absent flag implies False
+        pattern = re.compile(r'\breference_status=(\S+)')
+        reference_status = []
+        for _, comment in scan_states(inputs[0]):
+            match = pattern.search(comment)
+            value = match.group(1) if match is not None else 'F'
+            reference_status.append(value in ['T', 'True', 'true'])
+        reference_status = np.array(reference_status, dtype=bool)
+    return [int(i) for i in np.flatnonzero(reference_status == flag)]
 
 
 @typeguard.typechecked
@@ -183,87 +441,115 @@ def compute_metrics(
         elements: Optional[List[str]],
         metric: str,
         properties: List[str],
+        verify: bool = False,
         inputs: List[File] = [],
         ) -> np.ndarray:
     import numpy as np
     from ase.units import Pascal
-    from psiflow.data import read_dataset
+    from psiflow.data import load_dataset_arrays
     from psiflow.utils import get_index_element_mask
-    data_0 = read_dataset(slice(None), inputs=[inputs[0]])
+    arrays_0 = load_dataset_arrays(inputs[0])
     if len(inputs) == 1:
         assert intrinsic
-        data_1 = [a.copy() for a in data_0]
-        for atoms_1 in data_1:
-            if 'energy' in atoms_1.info.keys():
-                atoms_1.info['energy'] = 0.0
-            if 'stress' in atoms_1.info.keys(): # ASE copy fails for info attrs!
-                atoms_1.info['stress'] = np.zeros((3, 3))
-            if 'forces' in atoms_1.arrays.keys():
-                atoms_1.arrays['forces'][:] = 0.0
+        arrays_1 = dict(arrays_0) # has_* flags remain identical
+        arrays_1['energy'] = np.zeros_like(arrays_0['energy'])
+        arrays_1['forces'] = np.zeros_like(arrays_0['forces'])
+        arrays_1['stress'] = np.zeros_like(arrays_0['stress'])
     else:
-        data_1 = read_dataset(slice(None), inputs=[inputs[1]])
-    assert len(data_0) == len(data_1)
-    for atoms_0, atoms_1 in zip(data_0, data_1):
-        assert np.allclose(atoms_0.numbers, atoms_1.numbers)
-        assert np.allclose(atoms_0.positions, atoms_1.positions)
-        if atoms_0.cell is not None:
-            assert np.allclose(atoms_0.cell, atoms_1.cell)
-
-    errors = np.zeros((len(data_0), len(properties)))
-    outer_mask = np.array([True] * len(data_0))
-    for i in range(len(data_0)):
-        atoms_0 = data_0[i]
-        atoms_1 = data_1[i]
-        if (atom_indices is not None) or (elements is not None):
-            assert 'energy' not in properties
-            assert 'stress' not in properties
-            assert 'forces' in properties # only makes sense for forces
-            mask = get_index_element_mask(atoms_0.numbers, elements, atom_indices)
-        else:
-            mask = np.array([True] * len(atoms_0))
-        if not np.any(mask): # no target atoms present; skip
-            outer_mask[i] = False
-            continue
-        if 'energy' in properties:
-            assert 'energy' in atoms_0.info.keys()
-            assert 'energy' in atoms_1.info.keys()
-        if 'forces' in properties:
-            assert 'forces' in atoms_0.arrays.keys()
-            assert 'forces' in atoms_1.arrays.keys()
-        if 'stress' in properties:
-            assert 'stress' in atoms_0.info.keys()
-            assert 'stress' in atoms_1.info.keys()
-        for j, property_ in enumerate(properties):
-            if property_ == 'energy':
-                array_0 = np.array([atoms_0.info['energy']]).reshape((1, 1))
-                array_1 = np.array([atoms_1.info['energy']]).reshape((1, 1))
-                array_0 /= len(atoms_0) # per atom energy error
-                array_1 /= len(atoms_1)
-                array_0 *= 1000 # in meV/atom
-                array_1 *= 1000
-            elif property_ == 'forces':
-                array_0 = atoms_0.arrays['forces'][mask, :]
-                array_1 = atoms_1.arrays['forces'][mask, :]
-                array_0 *= 1000 # in meV/angstrom
-                array_1 *= 1000
-            elif property_ == 'stress':
-                array_0 = atoms_0.info['stress'].reshape((1, 9))
-                array_1 = atoms_1.info['stress'].reshape((1, 9))
-                array_0 /= (1e6 * Pascal) # in MPa
-                array_1 /= (1e6 * Pascal)
-            else:
-                raise ValueError('property {} unknown!'.format(property_))
+        arrays_1 = load_dataset_arrays(inputs[1])
+    natoms = arrays_0['natoms']
+    assert len(natoms) == len(arrays_1['natoms'])
+    assert np.array_equal(natoms, arrays_1['natoms'])
+    if verify: # check whether both datasets contain the same structures
+        assert np.allclose(arrays_0['numbers'], arrays_1['numbers'])
+        assert np.allclose(arrays_0['positions'], arrays_1['positions'])
+        assert np.allclose(arrays_0['cell'], arrays_1['cell'])
+
+    bounds = np.concatenate(([0], np.cumsum(natoms))).astype(int)
+    if (atom_indices is not None) or (elements is not None):
+        assert 'energy' not in properties
+        assert 'stress' not in properties
+        assert 'forces' in properties # only makes sense for forces
+        masks = []
+        unique_masks = {} # states with identical numbers share their mask
+        for i in range(len(natoms)):
+            numbers = arrays_0['numbers'][bounds[i]:bounds[i + 1]]
+            key = numbers.tobytes()
+            if key not in unique_masks:
+                unique_masks[key] = get_index_element_mask(
+                        numbers,
+                        elements,
+                        atom_indices,
+                        )
+            masks.append(unique_masks[key])
+    else:
+        masks = [np.ones(n, dtype=bool) for n in natoms]
+    # per-state reductions of the atom mask are performed on its flattened
+    # version, without looping over states
+    atom_mask = np.concatenate([np.zeros(0, dtype=bool)] + masks)
+    state_ids = np.repeat(np.arange(len(natoms)), natoms)
+    counts = np.bincount(
+            state_ids,
+            weights=atom_mask,
+            minlength=len(natoms),
+            ).astype(int) # number of atoms of interest per state
+    outer_mask = counts > 0
+    if not np.any(outer_mask): # no target atoms present in any state
+        raise AssertionError('no states in dataset contained atoms of interest')
+    selected = np.flatnonzero(outer_mask) # skip states without target atoms
+    for property_ in properties:
+        if property_ in ['energy', 'forces', 'stress']:
+            assert np.all(arrays_0['has_' + property_][selected])
+            assert np.all(arrays_1['has_' + property_][selected])
+    if metric not in ['mae', 'rmse', 'max']:
+        raise ValueError('metric {} unknown!'.format(metric))
+
+    # all selected states are stored contiguously, such that each metric is
+    # evaluated in a single pass instead of once per state
+    errors = np.zeros((len(selected), len(properties)))
+    for j, property_ in enumerate(properties):
+        if property_ == 'energy':
+            array_0 = arrays_0['energy'][selected]
+            array_1 = arrays_1['energy'][selected]
+            # per atom energy error in meV/atom; all metrics coincide
+            errors[:, j] = np.abs(array_0 - array_1) / natoms[selected] * 1000
+        elif property_ == 'forces':
+            counts_selected = counts[selected]
+            array_0 = arrays_0['forces'][atom_mask, :]
+            array_1 = arrays_1['forces'][atom_mask, :]
+            # masked arrays are copies; operate in-place to avoid temporaries
+            diffs = np.subtract(array_0, array_1, out=array_0)
+            diffs *= 1000 # in meV/angstrom
+            frame_ids = np.repeat(np.arange(len(selected)), counts_selected)
             if metric == 'mae':
-                errors[i, j] = np.mean(np.abs(array_0 - array_1))
-            elif metric == 'rmse':
-                errors[i, j] = np.mean(np.linalg.norm(array_0 - array_1, axis=1))
-            elif metric == 'max':
-                errors[i, j] = np.max(np.linalg.norm(array_0 - array_1, axis=1))
+                errors[:, j] = np.bincount(
+                        frame_ids,
+                        weights=np.sum(np.abs(diffs, out=diffs), axis=1),
+                        minlength=len(selected),
+                        ) / (3 * counts_selected)
             else:
-                raise ValueError('metric {} unknown!'.format(metric))
-    if not np.any(outer_mask):
-        raise AssertionError('no states in dataset contained atoms of interest')
-    return errors[outer_mask, :]
+                norms = np.sqrt(np.einsum('ij,ij->i', diffs, diffs))
+                if metric == 'rmse':
+                    errors[:, j] = np.bincount(
+                            frame_ids,
+                            weights=norms,
+                            minlength=len(selected),
+                            ) / counts_selected
+                else: # max
+                    offsets = np.concatenate(([0], np.cumsum(counts_selected)[:-1]))
+                    errors[:, j] = np.maximum.reduceat(norms, offsets)
+        elif property_ == 'stress':
+            array_0 = arrays_0['stress'][selected].reshape((-1, 9))
+            array_1 = arrays_1['stress'][selected].reshape((-1, 9))
+            diffs = np.subtract(array_0, array_1)
+            diffs /= (1e6 * Pascal) # in MPa
+            if metric == 'mae':
+                errors[:, j] = np.mean(np.abs(diffs, out=diffs), axis=1)
+            else: # norm of a single row
+                errors[:, j] = np.sqrt(np.einsum('ij,ij->i', diffs, diffs))
+        else:
+            raise ValueError('property {} unknown!'.format(property_))
+    return errors
 
 
 @typeguard.typechecked
@@ -309,10 +595,21 @@ class Dataset(Container):
                     ).outputs[0]
         else:
             assert atoms_list is None # do not allow additional atoms
-            self.data_future = copy_data_future(
-                    inputs=[data_future],
-                    outputs=[context.new_file('data_', '.xyz')],
-                    ).outputs[0] # ensure type(data_future) == DataFuture
+            if isinstance(data_future, DataFuture): # files are never modified
+                self.data_future = data_future
+            else:
+                self.data_future = copy_data_future(
+                        inputs=[data_future],
+                        outputs=[context.new_file('data_', '.xyz')],
+                        ).outputs[0] # ensure type(data_future) == DataFuture
+
+    def copy(self) -> Dataset:
+        """Returns a dataset which is backed by an independent copy of the file"""
+        data_future = copy_data_future(
+                inputs=[self.data_future],
+                outputs=[self.context.new_file('data_', '.xyz')],
+                ).outputs[0]
+        return Dataset(self.context, None, data_future=data_future)
 
     def length(self) -> AppFuture:
         return self.context.apps(Dataset, 'length_dataset')(inputs=[self.data_future])
@@ -353,6 +650,7 @@ class Dataset(Container):
             require_done: bool = True,
             ) -> AppFuture:
         future = copy_data_future(
+                copy_sidecar=False, # only the .xyz file is saved
                 inputs=[self.data_future],
                 outputs=[File(str(path_dataset))],
                 )
@@ -397,6 +695,7 @@ class Dataset(Container):
             elements: Optional[List[str]] = None,
             metric: str = 'rmse',
             properties: List[str] = ['energy', 'forces', 'stress'],
+            verify: bool = False,
             ) -> AppFuture:
         inputs = [dataset_0.data_future]
         if dataset_1 is not None:
@@ -410,6 +709,7 @@ class Dataset(Container):
                 elements=elements,
                 metric=metric,
                 properties=properties,
+                verify=verify,
                 inputs=inputs,
                 )
 
@@ -84,8 +84,10 @@ def conditional_sample(
                     )
             return data_future
         np.random.seed(batch_size) # ensure reproducibility
-        for i in range(batch_size):
-            index = np.random.randint(0, len(walkers))
+        # propagate distinct walkers such that none of the propagations in
+        # this batch depend on each other; recurse if more states are needed
+        indices = np.random.permutation(len(walkers))
+        for index in indices[:min(batch_size, len(walkers))]:
             walker = walkers[index]
             bias  = biases[index]
             state = walker.propagate(
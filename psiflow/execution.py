@@ -4,6 +4,7 @@ import typeguard
 from dataclasses import dataclass
 from pathlib import Path
 import logging
+from collections import Counter
 
 from parsl.dataflow.memoization import id_for_memo
 from parsl.data_provider.files import File
@@ -12,6 +13,8 @@ from parsl.executors import HighThroughputExecutor, ThreadPoolExecutor
 from parsl.data_provider.files import File
 from parsl.config import Config
 
+from psiflow.utils import typechecked
+
 
 logger = logging.getLogger(__name__) # logging per module
 logger.setLevel(logging.INFO)
@@ -46,10 +49,12 @@ class ReferenceExecutionDefinition(ExecutionDefinition):
     mpi_command: Optional[Callable] = lambda x: f'mpirun -np {x} '
     cp2k_exec  : str = 'cp2k.psmp' # default command for CP2K Reference
     time_per_singlepoint: float = 20
+    singlepoints_per_task: int = 1 # evaluated sequentially within one app
 
 
-@typeguard.typechecked
+@typechecked
 class ExecutionContext:
+    _max_files = 16 ** 6 # six hexadecimal digits per file identifier
 
     def __init__(
             self,
@@ -62,8 +67,8 @@ class ExecutionContext:
         self.path = Path(path)
         self.executor_labels = [e.label for e in config.executors]
         self.execution_definitions = {}
-        self._apps = {}
-        self.file_index = {}
+        self._apps = {} # keyed by (container, app_name)
+        self.file_index = Counter() # keyed by (prefix, suffix)
         assert 'default' in self.executor_labels
         logging.basicConfig(format='%(name)s - %(message)s')
         logging.getLogger('parsl').setLevel(logging.WARNING)
@@ -94,10 +99,11 @@ class ExecutionContext:
         self.execution_definitions[key] = execution
 
     def apps(self, container, app_name: str) -> Callable:
-        if container not in self._apps.keys():
+        key = (container, app_name)
+        if key not in self._apps:
             container.create_apps(self)
-        assert app_name in self._apps[container].keys()
-        return self._apps[container][app_name]
+            assert key in self._apps
+        return self._apps[key]
 
     def register_app(
             self,
@@ -105,22 +111,18 @@ class ExecutionContext:
             app_name: str,
             app: Callable,
             ) -> None:
-        if container not in self._apps.keys():
-            self._apps[container] = {}
-        assert app_name not in self._apps[container].keys()
-        self._apps[container][app_name] = app
+        key = (container, app_name)
+        assert key not in self._apps
+        self._apps[key] = app
 
     def new_file(self, prefix: str, suffix: str) -> File:
         assert prefix[-1] == '_'
         assert suffix[0]  == '.'
         key = (prefix, suffix)
-        if key not in self.file_index.keys():
-            self.file_index[key] = 0
-        padding = 6
-        assert self.file_index[key] < (16 ** padding)
-        identifier = '{0:0{1}x}'.format(self.file_index[key], padding)
-        self.file_index[key] += 1
-        return File(str(self.path / (prefix + identifier + suffix)))
+        index = self.file_index[key]
+        assert index < self._max_files
+        self.file_index[key] = index + 1
+        return File(str(self.path / f'{prefix}{index:06x}{suffix}'))
 
 
 @typeguard.typechecked
@@ -6,7 +6,6 @@ import logging
 from dataclasses import dataclass, field
 from pathlib import Path
 import shutil
-import wandb
 import numpy as np
 
 from parsl.app.app import python_app
@@ -13,10 +13,11 @@ from parsl.data_provider.files import File
 from psiflow.execution import Container, ModelExecutionDefinition, \
         ExecutionContext
 from psiflow.data import Dataset
-from psiflow.utils import copy_app_future, save_yaml, copy_data_future
+from psiflow.utils import copy_app_future, save_yaml, copy_data_future, \
+        typechecked
 
 
-@typeguard.typechecked
+@typechecked
 def evaluate_dataset(
         device: str,
         dtype: str,
@@ -25,19 +26,14 @@ def evaluate_dataset(
         inputs: List[File] = [],
         outputs: List[File] = [],
         ) -> None:
-    import torch
     import numpy as np
     from psiflow.data import read_dataset, save_dataset
-    if device == 'cpu':
-        torch.set_num_threads(ncores)
-    if dtype == 'float64':
-        torch.set_default_dtype(torch.float64)
-    else:
-        torch.set_default_dtype(torch.float32)
+    from psiflow.utils import set_torch_state, get_calculator
+    set_torch_state(device, ncores, dtype)
     dataset = read_dataset(slice(None), inputs=[inputs[0]])
     if len(dataset) > 0:
         atoms = dataset[0].copy()
-        atoms.calc = load_calculator(inputs[1].filepath, device, dtype)
+        atoms.calc = get_calculator(load_calculator, inputs[1].filepath, device, dtype)
         for _atoms in dataset:
             _atoms.calc = None
             atoms.set_positions(_atoms.get_positions())
@@ -1,3 +1,7 @@
+import functools
+import re
+import threading
+import weakref
 from dataclasses import dataclass
 
 from parsl.app.app import python_app
@@ -7,9 +11,23 @@ from psiflow.execution import ReferenceExecutionDefinition
 from .base import BaseReference
 
 
-def insert_filepaths_in_input(cp2k_input, filepaths):
-    from pymatgen.io.cp2k.inputs import Cp2kInput, Keyword, KeywordList
-    inp = Cp2kInput.from_string(cp2k_input)
+SENTINEL_ATOMS = '__PSIFLOW_ATOMS__'
+
+
+_SENTINEL_PATTERN = re.compile(r'__PSIFLOW_\w+?__')
+
+
+def sentinel_filepath(key):
+    return '__PSIFLOW_{}__'.format(key)
+
+
+def fill_sentinels(template, substitutions):
+    """Replaces all sentinels in a template in a single pass"""
+    return _SENTINEL_PATTERN.sub(lambda m: substitutions[m.group(0)], template)
+
+
+def insert_filepaths_in_input(inp, filepaths):
+    from pymatgen.io.cp2k.inputs import Keyword, KeywordList
     for key, path in filepaths.items():
         if isinstance(path, list): # set as KeywordList
             keywords = []
@@ -29,41 +47,177 @@ def insert_filepaths_in_input(cp2k_input, filepaths):
                     )
         else:
             raise ValueError('File key {} not recognized'.format(key))
-    return str(inp)
-
+    return inp
 
-def insert_atoms_in_input(cp2k_input, atoms):
-    from pymatgen.io.cp2k.inputs import Cp2kInput, Cell, Coord
-    from pymatgen.core import Lattice
-    from pymatgen.io.ase import AseAtomsAdaptor
-    structure = AseAtomsAdaptor.get_structure(atoms)
-    lattice = Lattice(atoms.get_cell())
 
-    inp = Cp2kInput.from_string(cp2k_input)
-    if not 'SUBSYS' in inp['FORCE_EVAL'].subsections.keys():
-        raise ValueError('No subsystem present in cp2k input: {}'.format(cp2k_input))
-    inp['FORCE_EVAL']['SUBSYS'].insert(Coord(structure))
-    inp['FORCE_EVAL']['SUBSYS'].insert(Cell(lattice))
-    return str(inp)
-
-
-def regularize_input(cp2k_input):
+def regularize_input(inp):
     """Ensures forces and stress are printed; removes topology/cell info"""
-    from pymatgen.io.cp2k.inputs import Cp2kInput
-    inp = Cp2kInput.from_string(cp2k_input)
     inp.update({'FORCE_EVAL': {'SUBSYS': {'CELL': {}}}})
     inp.update({'FORCE_EVAL': {'SUBSYS': {'TOPOLOGY': {}}}})
     inp.update({'FORCE_EVAL': {'SUBSYS': {'COORD': {}}}})
     inp.update({'FORCE_EVAL': {'PRINT': {'FORCES': {}}}})
     inp.update({'FORCE_EVAL': {'PRINT': {'STRESS_TENSOR': {}}}})
-    return str(inp)
+    return inp
 
 
-def set_global_section(cp2k_input):
-    from pymatgen.io.cp2k.inputs import Cp2kInput, Global
-    inp = Cp2kInput.from_string(cp2k_input)
+def set_global_section(inp):
+    from pymatgen.io.cp2k.inputs import Global
     inp.subsections['GLOBAL'] = Global(project_name='_electron')
-    return str(inp)
+    return inp
+
+
+def render_atoms(atoms):
+    """Renders the COORD and CELL sections of an atoms instance
+
+    Sections are formatted directly from positions and cell vectors (in
+    angstrom), without intermediate pymatgen structures.
+
+    """
+    lines = ['&COORD']
+    for symbol, (x, y, z) in zip(atoms.get_chemical_symbols(), atoms.get_positions()):
+        lines.append(f'  {symbol} {x:.10f} {y:.10f} {z:.10f}')
+    lines.append('&END COORD')
+    lines.append('&CELL')
+    for name, (x, y, z) in zip('ABC', atoms.get_cell()):
+        lines.append(f'  {name} {x:.10f} {y:.10f} {z:.10f}')
+    lines.append('&END CELL')
+    return '\n'.join(lines)
+
+
+_cp2k_data_dirs = {} # persistent data directories in this worker process
+_cp2k_data_digests = weakref.WeakKeyDictionary() # per parameters instance
+_cp2k_data_lock = threading.Lock()
+
+
+def get_cp2k_data_digest(parameters):
+    """Returns the SHA-256 digest of the cp2k data files of parameters
+
+    The digest is computed only once per parameters instance; the data files
+    of an instance should therefore not be modified.
+
+    """
+    import hashlib
+    if parameters not in _cp2k_data_digests: # same instance for batched states
+        digest = hashlib.sha256()
+        for key in sorted(parameters.cp2k_data.keys()):
+            digest.update(key.encode())
+            digest.update(b'\0')
+            digest.update(parameters.cp2k_data[key].encode())
+            digest.update(b'\0')
+        _cp2k_data_digests[parameters] = digest.hexdigest()
+    return _cp2k_data_digests[parameters]
+
+
+def get_cp2k_data_dir(parameters):
+    """Returns a directory in which the cp2k data files have been written
+
+    Files are written only once per process for each distinct set of data
+    files, in a parent directory which is specific to the process (i.e.
+    psiflow_cp2k_data_<pid> in the temporary directory). The parent is
+    removed when the process exits normally; those of killed processes can
+    be identified by their pid.
+
+    """
+    import atexit
+    import os
+    import shutil
+    import tempfile
+    from pathlib import Path
+    digest = get_cp2k_data_digest(parameters)
+    with _cp2k_data_lock: # threadpool workers share the process
+        if digest not in _cp2k_data_dirs:
+            path_parent = Path(tempfile.gettempdir()) / 'psiflow_cp2k_data_{}'.format(os.getpid())
+            if not _cp2k_data_dirs: # first data directory of this process
+                path_parent.mkdir(exist_ok=True)
+                atexit.register(shutil.rmtree, path_parent, ignore_errors=True)
+            path = path_parent / digest
+            path.mkdir(exist_ok=True)
+            for key, content in parameters.cp2k_data.items():
+                with open(path / key, 'w') as f:
+                    f.write(content)
+            _cp2k_data_dirs[digest] = path
+        return _cp2k_data_dirs[digest]
+
+
+_CP2K_OUTPUT_PATTERN = re.compile(
+        r'(?P<energy>ENERGY\| Total FORCE_EVAL.*:\s+(?P<value>\S+))'
+        r'|(?P<forces>ATOMIC FORCES in)'
+        r'|(?P<stress>STRESS TENSOR \[GPa\]|STRESS\|\s+\w+ stress tensor \[GPa\])'
+        )
+
+
+def parse_cp2k_output(path_output):
+    """Extracts energy, forces and stress from a CP2K output in a single pass
+
+    Only the first occurrence of each quantity is retained. Energy and forces
+    are returned in atomic units, the stress in GPa; quantities which are
+    absent from the output are returned as None. Both the 'STRESS|' table of
+    CP2K >= 7 and the older 'STRESS TENSOR [GPa]' block are recognized.
+
+    """
+    import numpy as np
+    energy, forces, stress = None, None, None
+    with open(path_output, 'r', errors='replace') as f:
+        for line in f:
+            match = _CP2K_OUTPUT_PATTERN.search(line)
+            if match is None:
+                continue
+            if match.group('energy') and (energy is None):
+                energy = float(match.group('value'))
+            elif match.group('forces') and (forces is None):
+                forces = []
+                for line in f: # '# Atom Kind Element X Y Z' header first
+                    if line.strip().startswith('SUM OF ATOMIC FORCES'):
+                        break
+                    fields = line.split()
+                    if (len(fields) == 6) and fields[0].isdigit():
+                        forces.append([float(x) for x in fields[3:]])
+                forces = np.array(forces)
+            elif match.group('stress') and (stress is None):
+                stress = []
+                for line in f: # 'x y z' header, followed by three rows
+                    fields = line.split()
+                    if fields and (fields[0] == 'STRESS|'): # CP2K >= 7
+                        fields = fields[1:]
+                    if (len(fields) == 4) and (fields[0] in ('X', 'Y', 'Z', 'x', 'y', 'z')):
+                        stress.append([float(x) for x in fields[1:]])
+                    if len(stress) == 3:
+                        break
+                stress = np.array(stress)
+            if (energy is not None) and (forces is not None) and \
+                    (stress is not None):
+                break
+    return energy, forces, stress
+
+
+@functools.lru_cache(maxsize=8)
+def get_cp2k_template(cp2k_input, keys):
+    """Renders an input with sentinels for the data file paths and atoms
+
+    All structure-independent modifications are applied only once per
+    process; singlepoints only need to substitute the sentinels.
+
+    """
+    from pymatgen.io.cp2k.inputs import Cp2kInput
+    inp = Cp2kInput.from_string(cp2k_input)
+    inp = insert_filepaths_in_input(
+            inp,
+            {key: sentinel_filepath(key) for key in keys},
+            )
+    inp = regularize_input(inp)
+    if not 'SUBSYS' in inp['FORCE_EVAL'].subsections.keys():
+        raise ValueError('No subsystem present in cp2k input: {}'.format(cp2k_input))
+    subsys = inp['FORCE_EVAL']['SUBSYS']
+    for name in list(subsys.subsections.keys()): # replaced by sentinel
+        if name.upper() in ['COORD', 'CELL']:
+            subsys.subsections.pop(name)
+    inp = set_global_section(inp)
+    lines = str(inp).split('\n')
+    for i, line in enumerate(lines):
+        if line.strip().upper().startswith('&SUBSYS'):
+            lines.insert(i + 1, SENTINEL_ATOMS)
+            break
+    return '\n'.join(lines)
 
 
 def cp2k_singlepoint(
@@ -77,90 +231,88 @@ def cp2k_singlepoint(
     import tempfile
     import subprocess
     import ase
-    import glob
     import os
     import shlex
     import parsl
     from pathlib import Path
     import numpy as np
     from ase.units import Hartree, Bohr
-    from pymatgen.io.cp2k.outputs import Cp2kOutput
-    from psiflow.reference._cp2k import insert_filepaths_in_input, \
-            insert_atoms_in_input, set_global_section
+    from psiflow.reference._cp2k import get_cp2k_template, render_atoms, \
+            sentinel_filepath, SENTINEL_ATOMS, parse_cp2k_output, \
+            get_cp2k_data_dir, fill_sentinels
 
     command_list = [command]
     with tempfile.TemporaryDirectory() as tmpdir:
-        # write data files as required by cp2k
-        filepaths = {}
-        for key, content in parameters.cp2k_data.items():
-            filepaths[key] = Path(tmpdir) / key
-            with open(filepaths[key], 'w') as f:
-                f.write(content)
-        cp2k_input = insert_filepaths_in_input(
+        # data files as required by cp2k are shared between singlepoints
+        path_data = get_cp2k_data_dir(parameters)
+        filepaths = {key: path_data / key for key in parameters.cp2k_data}
+        cp2k_input = get_cp2k_template( # parsed once per process
                 parameters.cp2k_input,
-                filepaths,
-                )
-        cp2k_input = regularize_input(cp2k_input) # before insert_atoms_in_input
-        cp2k_input = insert_atoms_in_input(
-                cp2k_input,
-                atoms,
+                tuple(parameters.cp2k_data.keys()),
                 )
-        cp2k_input = set_global_section(cp2k_input)
+        substitutions = {sentinel_filepath(k): str(p) for k, p in filepaths.items()}
+        substitutions[SENTINEL_ATOMS] = render_atoms(atoms)
+        cp2k_input = fill_sentinels(cp2k_input, substitutions)
         path_input  = Path(tmpdir) / 'cp2k_input.txt'
         with open(Path(tmpdir) / 'cp2k_input.txt', 'w') as f:
             f.write(cp2k_input)
         command_list.append(' -i {}'.format(path_input))
         os.environ['OMP_NUM_THREADS'] = '1'
-        try:
-            result = subprocess.run(
+        path_output = Path(tmpdir) / 'cp2k_output.txt' # stdout is streamed
+        timeout = False
+        with open(path_output, 'wb') as f_output:
+            process = subprocess.Popen(
                     shlex.split(' '.join(command_list)), # proper splitting
                     #env=dict(os.environ),
                     #env={'OMP_NUM_THREADS': '1'},
                     shell=False, # to be able to use timeout
-                    capture_output=True,
-                    text=True,
-                    timeout=walltime,
+                    cwd=tmpdir, # wavefunction files are removed with tmpdir
+                    stdout=f_output,
+                    stderr=subprocess.PIPE,
                     )
-            stdout = result.stdout
-            stderr = result.stderr
-            timeout = False
-            returncode = result.returncode
-            success = (returncode == 0)
-        except subprocess.CalledProcessError as e:
-            stdout = result.stdout
-            stderr = result.stderr
-            timeout = False
-            returncode = 1
-            success = False
-            #print(e)
-        except parsl.app.errors.AppTimeout as e: # subprocess.TimeoutExpired
-            #stdout = e.stdout.decode('utf-8') # no result variable in this case
-            #stderr = e.stderr
-            stdout = ''
+            try:
+                _, stderr = process.communicate(
+                        timeout=(walltime if walltime > 0 else None),
+                        )
+            except (parsl.app.errors.AppTimeout, subprocess.TimeoutExpired) as e:
+                timeout = True
+            finally: # never leave cp2k running after the app returns
+                if process.poll() is None:
+                    process.kill()
+                    process.communicate()
+        if timeout:
             stderr = 'subprocess walltime ({}s) reached'.format(walltime)
-            timeout = True
             returncode = 1
-            success = False
+        else: # only the tail of stderr is relevant for diagnostics
+            stderr = stderr[-(1 << 16):].decode(errors='replace')
+            returncode = process.returncode
+        success = (returncode == 0)
+        if success:
+            energy, forces, stress = parse_cp2k_output(path_output)
+            if (energy is None) or (forces is None) or (stress is None):
+                stderr += '\nunable to parse energy, forces and stress from output'
+                success = False
         print('success: {}\treturncode: {}\ttimeout: {}'.format(success, returncode, timeout))
-        atoms.reference_log = stdout
         if success:
             atoms.reference_status = True
-            with tempfile.NamedTemporaryFile(delete=False, mode='w+') as tmp:
-                tmp.write(atoms.reference_log)
-            out = Cp2kOutput(tmp.name)
-            out.parse_energies()
-            out.parse_forces()
-            out.parse_stresses()
-            energy = out.data['total_energy'][0] # already in eV
-            forces = np.array(out.data['forces'][0]) * (Hartree / Bohr) # to eV/A
-            stress = np.array(out.data['stress_tensor'][0]) * 1000 # to MPa
+            if parameters.keep_log: # large; only returned if requested
+                with open(path_output, 'r', errors='replace') as f:
+                    atoms.reference_log = f.read()
+            else:
+                atoms.reference_log = ''
+            energy *= Hartree # to eV
+            forces *= (Hartree / Bohr) # to eV/A; arrays are freshly parsed
+            stress *= 1000 # to MPa
             atoms.info['energy'] = energy
             atoms.info['stress'] = stress
             atoms.arrays['forces'] = forces
-            for file in glob.glob('_electron-RESTART.wfn*'):
-                os.remove(file) # include .wfn.bak-
         else:
             atoms.reference_status = False
+            if timeout:
+                atoms.reference_log = ''
+            else:
+                with open(path_output, 'r', errors='replace') as f:
+                    atoms.reference_log = f.read()
             atoms.reference_log += '\n\n STDERR\n' + stderr
             # remove properties keys in atoms if present
             atoms.info.pop('energy', None)
@@ -169,19 +321,47 @@ def cp2k_singlepoint(
         return atoms
 
 
-@dataclass
+def cp2k_singlepoint_batch(
+        states,
+        parameters,
+        command,
+        time_per_singlepoint=0, # not 'walltime'; parsl applies it per app
+        inputs=[],
+        outputs=[],
+        ):
+    """Evaluates a list of states sequentially within a single app"""
+    from psiflow.reference._cp2k import cp2k_singlepoint
+    evaluated = []
+    for atoms in states:
+        evaluated.append(cp2k_singlepoint(
+            atoms,
+            parameters,
+            command,
+            walltime=time_per_singlepoint, # timeout of subprocess
+            ))
+    return evaluated
+
+
+@dataclass(eq=False) # hashable by id; necessary for weak references
 class CP2KParameters:
     cp2k_input : str
     cp2k_data  : dict
+    keep_log   : bool = False
+
+
+_cp2k_id_cache = weakref.WeakKeyDictionary() # memo ids per parameters instance
 
 
 @id_for_memo.register(CP2KParameters)
 def id_for_memo_cp2k_parameters(parameters: CP2KParameters, output_ref=False):
     assert not output_ref
-    # never really necessary to check for data equivalence?
-    b1 = id_for_memo(parameters.cp2k_input, output_ref=output_ref)
-    b2 = id_for_memo(parameters.cp2k_data,  output_ref=output_ref)
-    return b1 + b2
+    if parameters not in _cp2k_id_cache: # same instance for all states
+        # never really necessary to check for data equivalence?
+        b1 = id_for_memo(parameters.cp2k_input, output_ref=output_ref)
+        b2 = id_for_memo(parameters.cp2k_data,  output_ref=output_ref)
+        b3 = id_for_memo(parameters.keep_log,   output_ref=output_ref)
+        _cp2k_id_cache[parameters] = b1 + b2 + b3
+    return _cp2k_id_cache[parameters]
 
 
 class CP2KReference(BaseReference):
@@ -201,6 +381,10 @@ class CP2KReference(BaseReference):
         The keys of the dictionary correspond to the capitalized keys in
         the cp2k input (e.g. BASIS_SET_FILE_NAME)
 
+    keep_log : bool
+        whether to store the cp2k output in the reference_log of successful
+        singlepoints. Logs of failed singlepoints are always kept.
+
     """
     parameters_cls = CP2KParameters
 
@@ -211,6 +395,7 @@ class CP2KReference(BaseReference):
         mpi_command = context[ReferenceExecutionDefinition].mpi_command
         cp2k_exec = context[ReferenceExecutionDefinition].cp2k_exec
         walltime = context[ReferenceExecutionDefinition].time_per_singlepoint
+        batch_size = context[ReferenceExecutionDefinition].singlepoints_per_task
 
         # parse full command
         command = ''
@@ -238,4 +423,21 @@ class CP2KReference(BaseReference):
                     outputs=[],
                     )
         context.register_app(cls, 'evaluate_single', singlepoint_wrapped)
-        super(CP2KReference, cls).create_apps(context)
+
+        singlepoint_batch_unwrapped = python_app(
+                cp2k_singlepoint_batch,
+                executors=[label],
+                cache=True,
+                )
+        def singlepoint_batch_wrapped(states, parameters, inputs=[], outputs=[]):
+            assert len(outputs) == 0
+            return singlepoint_batch_unwrapped(
+                    states=states,
+                    parameters=parameters,
+                    command=command,
+                    time_per_singlepoint=walltime,
+                    inputs=inputs,
+                    outputs=[],
+                    )
+        context.register_app(cls, 'evaluate_batch', singlepoint_batch_wrapped)
+        super(CP2KReference, cls).create_apps(context, batch_size=batch_size)
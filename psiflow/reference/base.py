@@ -84,18 +84,42 @@ class BaseReference(Container):
         return retval
 
     @classmethod
-    def create_apps(cls, context: ExecutionContext) -> None:
+    def create_apps(
+            cls,
+            context: ExecutionContext,
+            batch_size: int = 1,
+            ) -> None:
+        """Registers evaluate_multiple
+
+        If batch_size is larger than one, states are submitted in batches to
+        the 'evaluate_batch' app, which should be registered by the subclass.
+
+        """
         assert not (cls == BaseReference) # should never be called directly
+        assert batch_size > 0
         def evaluate_multiple(parameters, nstates, inputs=[], outputs=[]):
             assert len(outputs) == 1
             data = []
-            for i in range(nstates):
-                data.append(context.apps(cls, 'evaluate_single')(
-                    read_dataset(i, inputs=[inputs[0]], outputs=[]),
-                    parameters,
-                    inputs=[],
-                    outputs=[],
-                    ))
+            if batch_size == 1:
+                for i in range(nstates):
+                    data.append(context.apps(cls, 'evaluate_single')(
+                        read_dataset(i, inputs=[inputs[0]], outputs=[]),
+                        parameters,
+                        inputs=[],
+                        outputs=[],
+                        ))
+            else: # each future represents a list of evaluated states
+                for start in range(0, nstates, batch_size):
+                    data.append(context.apps(cls, 'evaluate_batch')(
+                        read_dataset(
+                            slice(start, start + batch_size),
+                            inputs=[inputs[0]],
+                            outputs=[],
+                            ),
+                        parameters,
+                        inputs=[],
+                        outputs=[],
+                        ))
             return context.apps(Dataset, 'save_dataset')(
                     None,
                     return_data=True,
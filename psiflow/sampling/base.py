@@ -16,7 +16,7 @@ from psiflow.execution import ModelExecutionDefinition, Container, \
         ExecutionContext
 from psiflow.utils import copy_app_future, unpack_i, copy_data_future, \
         save_yaml
-from psiflow.data import save_atoms, FlowAtoms, Dataset
+from psiflow.data import save_states, FlowAtoms, Dataset
 
 
 @typeguard.typechecked
@@ -157,14 +157,10 @@ class BaseWalker(Container):
         path_start = path / 'start.xyz'
         path_state = path / 'state.xyz'
         path_pars  = path / (name + '.yaml')
-        future_start = save_atoms(
-                self.start_future,
-                outputs=[File(str(path_start))],
-                ).outputs[0]
-        future_state = save_atoms(
-                self.state_future,
-                outputs=[File(str(path_state))],
-                ).outputs[0]
+        future_start, future_state = save_states( # single app for both
+                inputs=[self.start_future, self.state_future],
+                outputs=[File(str(path_start)), File(str(path_state))],
+                ).outputs
         future_pars = save_yaml(
                 asdict(self.parameters),
                 outputs=[File(str(path_pars))],
@@ -3,8 +3,6 @@ from typing import Optional, Union, List, Tuple, Dict, Callable
 import typeguard
 import os
 import tempfile
-import yaff
-import molmod
 import numpy as np
 from pathlib import Path
 from collections import OrderedDict
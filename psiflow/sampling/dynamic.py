@@ -10,12 +10,12 @@ from parsl.dataflow.memoization import id_for_memo
 
 from psiflow.data import Dataset, FlowAtoms
 from psiflow.execution import ModelExecutionDefinition, ExecutionContext
-from psiflow.utils import copy_data_future, unpack_i
+from psiflow.utils import copy_data_future, unpack_i, typechecked
 from psiflow.sampling import BaseWalker, PlumedBias
 from psiflow.models import BaseModel
 
 
-@typeguard.typechecked
+@typechecked
 def simulate_model(
         device: str,
         ncores: int,
@@ -40,21 +40,21 @@ def simulate_model(
     from psiflow.sampling.utils import ForcePartASE, DataHook, \
             create_forcefield, ForceThresholdExceededException, ForcePartPlumed
     from psiflow.sampling.bias import try_manual_plumed_linking
-    if device == 'cpu':
-        torch.set_num_threads(ncores)
-    if dtype == 'float64':
-        torch.set_default_dtype(torch.float64)
-    else:
-        torch.set_default_dtype(torch.float32)
+    from psiflow.utils import set_torch_state, get_calculator
+    set_torch_state(device, ncores, dtype) # no-op for subsequent apps
     pars = parameters
     np.random.seed(pars.seed)
     torch.manual_seed(pars.seed)
     atoms = state.copy()
-    atoms.calc = load_calculator(inputs[0].filepath, device, dtype)
+    atoms.calc = get_calculator(load_calculator, inputs[0].filepath, device, dtype)
     forcefield = create_forcefield(atoms, pars.force_threshold)
 
     loghook  = yaff.VerletScreenLog(step=pars.step, start=0)
-    datahook = DataHook(start=pars.start, step=pars.step)
+    datahook = DataHook( # only last snapshot is required if not keep_trajectory
+            start=pars.start,
+            step=pars.step,
+            keep_all=keep_trajectory,
+            )
     hooks = []
     hooks.append(loghook)
     hooks.append(datahook)
@@ -131,17 +131,22 @@ def simulate_model(
         os.unlink(path_log)
         os.unlink(path_plumed)
 
-    # update state with last stored state if data nonempty
-    if len(datahook.data) > 0:
-        state.set_positions(datahook.data[-1].get_positions())
-        state.set_cell(datahook.data[-1].get_cell())
+    # reuse the copy of the initial state as output; the input state is not
+    # modified, which matters for executors which do not serialize arguments
+    atoms.calc = None # calculator is cached and shared between apps
+    if len(datahook.data) > 0: # update with last stored state if nonempty
+        atoms.set_positions(datahook.data[-1].get_positions())
+        atoms.set_cell(datahook.data[-1].get_cell())
+    else: # MD may have modified positions/cell before any data was stored
+        atoms.set_positions(state.get_positions())
+        atoms.set_cell(state.get_cell())
 
     # write data to output xyz
     if keep_trajectory:
         assert str(outputs[0].filepath).endswith('.xyz')
         with open(outputs[0], 'w+') as f:
             write_extxyz(f, datahook.data)
-    return FlowAtoms.from_atoms(state), tag
+    return atoms, tag
 
 
 @typeguard.typechecked
@@ -180,7 +185,7 @@ class DynamicWalker(BaseWalker):
                 executors=[label],
                 cache=True,
                 )
-        @typeguard.typechecked
+        @typechecked
         def propagate_wrapped(
                 state: AppFuture,
                 parameters: DynamicParameters,
@@ -11,10 +11,11 @@ from psiflow.data import Dataset, FlowAtoms
 from psiflow.execution import Container, ModelExecutionDefinition, \
         ExecutionContext
 from psiflow.sampling.base import BaseWalker
+from psiflow.utils import typechecked
 from psiflow.models import BaseModel
 
 
-@typeguard.typechecked
+@typechecked
 def optimize_geometry(
         device: str,
         ncores: int,
@@ -35,15 +36,14 @@ def optimize_geometry(
     from ase.io import read
     from ase.io.extxyz import write_extxyz
     from psiflow.data import FlowAtoms
-    torch.set_default_dtype(torch.float64) # optimization always in double
-    if device == 'cpu':
-        torch.set_num_threads(ncores)
+    from psiflow.utils import set_torch_state, get_calculator
+    set_torch_state(device, ncores, 'float64') # optimization always in double
 
     pars = parameters
     np.random.seed(pars.seed)
     torch.manual_seed(pars.seed)
     atoms = state.copy()
-    atoms.calc = load_calculator(inputs[0].filepath, device, dtype='float64')
+    atoms.calc = get_calculator(load_calculator, inputs[0].filepath, device, 'float64')
     preconditioner = Exp(A=3) # from ASE docs
     if parameters.optimize_cell: # include cell DOFs in optimization 
         try: # some models do not have stress support; prevent full cell opt!
@@ -105,7 +105,7 @@ class OptimizationWalker(BaseWalker):
                 optimize_geometry,
                 executors=[label],
                 )
-        @typeguard.typechecked
+        @typechecked
         def optimize_wrapped(
                 state: AppFuture,
                 parameters: OptimizationParameters,
@@ -9,10 +9,11 @@ from parsl.dataflow.futures import AppFuture
 from psiflow.data import FlowAtoms
 from psiflow.execution import ModelExecutionDefinition, ExecutionContext
 from psiflow.sampling import BaseWalker, PlumedBias
+from psiflow.utils import typechecked
 from psiflow.models import BaseModel
 
 
-@typeguard.typechecked
+@typechecked
 def random_perturbation(
         state: FlowAtoms,
         parameters: RandomParameters,
@@ -60,7 +61,7 @@ class RandomWalker(BaseWalker):
                 random_perturbation,
                 executors=[label],
                 )
-        @typeguard.typechecked
+        @typechecked
         def propagate_wrapped(
                 state: AppFuture,
                 parameters: RandomParameters,
@@ -2,9 +2,11 @@ import os
 import molmod
 import yaff
 import numpy as np
+from pathlib import Path
 
 from ase.geometry import Cell
 from ase import Atoms
+from ase.io.extxyz import write_extxyz
 
 
 class ForcePartPlumed(yaff.external.ForcePartPlumed):
@@ -72,14 +74,19 @@ class ForcePartASE(yaff.pes.ForcePart):
         self.atoms  = atoms
         self.force_threshold = force_threshold
 
+        # unit conversions between yaff (atomic units) and ASE
+        self._inv_angstrom = 1.0 / molmod.units.angstrom
+        self._electronvolt = molmod.units.electronvolt
+        self._neg_force_conversion = -molmod.units.electronvolt / molmod.units.angstrom
+
     def _internal_compute(self, gpos=None, vtens=None):
-        self.atoms.set_positions(self.system.pos / molmod.units.angstrom)
-        self.atoms.set_cell(Cell(self.system.cell._get_rvecs() / molmod.units.angstrom))
-        energy = self.atoms.get_potential_energy() * molmod.units.electronvolt
+        self.atoms.set_positions(self.system.pos * self._inv_angstrom)
+        self.atoms.set_cell(Cell(self.system.cell._get_rvecs() * self._inv_angstrom))
+        energy = self.atoms.get_potential_energy() * self._electronvolt
         if gpos is not None:
             forces = self.atoms.get_forces()
             self.check_threshold(forces)
-            gpos[:] = -forces * molmod.units.electronvolt / molmod.units.angstrom
+            np.multiply(forces, self._neg_force_conversion, out=gpos)
         if vtens is not None:
             try: # some models do not have stress support
                 stress = atoms.get_stress(voigt=False)
@@ -87,12 +94,17 @@ class ForcePartASE(yaff.pes.ForcePart):
                 print(e)
                 stress = np.zeros((3, 3))
             volume = np.linalg.det(self.atoms.get_cell())
-            vtens[:] = volume * stress * molmod.units.electronvolt
+            np.multiply(stress, volume * self._electronvolt, out=vtens)
         return energy
 
     def check_threshold(self, forces):
-        max_force = np.max(np.linalg.norm(forces, axis=1))
-        index = np.argmax(np.linalg.norm(forces, axis=1))
+        # upper bound on the norms; reductions do not allocate temporaries
+        max_component = max(np.max(forces), -np.min(forces))
+        if np.sqrt(3) * max_component <= self.force_threshold:
+            return
+        norms = np.linalg.norm(forces, axis=1)
+        index = int(np.argmax(norms))
+        max_force = norms[index]
         if max_force > self.force_threshold:
             raise ForceThresholdExceededException(
                     'Max force exceeded: {} eV/A by atom index {}'.format(max_force, index),
@@ -112,11 +124,13 @@ def create_forcefield(atoms, force_threshold):
 
 
 class DataHook(yaff.VerletHook):
+    """Stores snapshots; only retains the most recent one if not keep_all"""
 
-    def __init__(self, start=0, step=1):
+    def __init__(self, start=0, step=1, keep_all=True):
         super().__init__(start, step)
         self.atoms = None
         self.data = []
+        self.keep_all = keep_all
 
     def init(self, iterative):
         self.atoms = Atoms(
@@ -135,7 +149,10 @@ class DataHook(yaff.VerletHook):
     def __call__(self, iterative):
         self.atoms.set_positions(iterative.ff.system.pos / molmod.units.angstrom)
         self.atoms.set_cell(iterative.ff.system.cell._get_rvecs() / molmod.units.angstrom)
-        self.data.append(self.atoms.copy())
+        if self.keep_all:
+            self.data.append(self.atoms.copy())
+        elif len(self.data) == 0: # single snapshot which is updated in place
+            self.data.append(self.atoms)
 
 
 class ExtXYZHook(yaff.VerletHook): # xyz file writer; obsolete
@@ -145,6 +162,10 @@ class ExtXYZHook(yaff.VerletHook): # xyz file writer; obsolete
         Path(path_xyz).unlink(missing_ok=True) # remove if exists
         self.path_xyz = path_xyz
         self.atoms = None
+        self._f = open(path_xyz, 'a', buffering=1 << 20) # kept open
+
+    def close(self):
+        self._f.close()
 
     def init(self, iterative):
         self.atoms = Atoms(
@@ -163,7 +184,7 @@ class ExtXYZHook(yaff.VerletHook): # xyz file writer; obsolete
     def __call__(self, iterative):
         self.atoms.set_positions(iterative.ff.system.pos / molmod.units.angstrom)
         self.atoms.set_cell(iterative.ff.system.cell._get_rvecs() / molmod.units.angstrom)
-        write(self.path_xyz, self.atoms, append=True)
+        write_extxyz(self._f, self.atoms)
 
 
 def apply_strain(strain, box0):
@@ -1,11 +1,11 @@
 from __future__ import annotations # necessary for type-guarding class methods
-from typing import Optional, Union, List, Any, Tuple, Dict
+from typing import Optional, Union, List, Any, Tuple, Dict, Callable
 import typeguard
+import functools
 import os
 import sys
 import tempfile
 import numpy as np
-import wandb
 import importlib
 from pathlib import Path
 
@@ -17,6 +17,18 @@ from parsl.dataflow.futures import AppFuture
 from parsl.config import Config
 
 
+def typechecked(func):
+    """Applies typeguard.typechecked only if PSIFLOW_TYPECHECK is set
+
+    Used for functions on the task submission and execution path, for which
+    runtime type checking is a per-call overhead.
+
+    """
+    if os.environ.get('PSIFLOW_TYPECHECK', '') not in ['', '0']:
+        return typeguard.typechecked(func)
+    return func
+
+
 @typeguard.typechecked
 def _create_if_empty(outputs: List[File] = []) -> None:
     try:
@@ -55,30 +67,98 @@ def get_index_element_mask(
         elements: Optional[List[str]],
         atom_indices: Optional[List[int]],
         ) -> np.ndarray:
-    mask = np.array([True] * len(numbers))
+    mask = np.ones(len(numbers), dtype=bool)
 
     if elements is not None:
         numbers_to_include = [atomic_numbers[e] for e in elements]
-        mask_elements = np.array([False] * len(numbers))
-        for number in numbers_to_include:
-            mask_elements = np.logical_or(mask_elements, (numbers == number))
+        mask_elements = np.isin(numbers, numbers_to_include)
         mask = np.logical_and(mask, mask_elements)
 
     if atom_indices is not None:
-        mask_indices = np.array([False] * len(numbers))
+        mask_indices = np.zeros(len(numbers), dtype=bool)
         mask_indices[np.array(atom_indices)] = True
         mask = np.logical_and(mask, mask_indices)
     return mask
 
 
 @typeguard.typechecked
-def _copy_data_future(inputs: List[File] = [], outputs: List[File] = []) -> None:
+def set_torch_state(device: str, ncores: int, dtype: str) -> None:
+    """Sets number of threads and default dtype of torch in this process
+
+    Both are global to the worker process, and are only modified when they
+    differ from the requested values such that subsequent apps in the same
+    worker do not reinitialize them.
+
+    """
+    import torch
+    if (device == 'cpu') and (torch.get_num_threads() != ncores):
+        torch.set_num_threads(ncores)
+    if dtype == 'float64':
+        _dtype = torch.float64
+    else:
+        _dtype = torch.float32
+    if torch.get_default_dtype() != _dtype:
+        torch.set_default_dtype(_dtype)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_calculator(
+        load_calculator: Callable,
+        path_model: str,
+        mtime_ns: int,
+        size: int,
+        device: str,
+        dtype: str,
+        thread_id: int,
+        ):
+    return load_calculator(path_model, device, dtype)
+
+
+@typeguard.typechecked
+def get_calculator(
+        load_calculator: Callable,
+        path_model: Union[Path, str],
+        device: str,
+        dtype: str,
+        ):
+    """Loads a deployed model as calculator, using a process-local cache
+
+    Apps which run in the same worker thread and use the same (unmodified)
+    deployed model share a single calculator instance. Calculators store the
+    last evaluated state, so they are never shared between threads; their
+    results are reset such that no properties of a previous state are reused.
+
+    """
+    import threading
+    stat = os.stat(path_model)
+    calculator = _load_calculator(
+            load_calculator,
+            os.fspath(path_model),
+            stat.st_mtime_ns,
+            stat.st_size,
+            device,
+            dtype,
+            threading.get_ident(),
+            )
+    calculator.reset()
+    return calculator
+
+
+@typeguard.typechecked
+def _copy_data_future(
+        copy_sidecar: bool = True,
+        inputs: List[File] = [],
+        outputs: List[File] = [],
+        ) -> None:
     import shutil
     from pathlib import Path
     assert len(inputs)  == 1
     assert len(outputs) == 1
     if Path(inputs[0]).is_file():
         shutil.copyfile(inputs[0], outputs[0])
+        path_cache = Path(inputs[0].filepath + '.npz') # binary sidecar of .xyz
+        if copy_sidecar and path_cache.is_file(): # copied after .xyz to remain valid
+            shutil.copyfile(path_cache, outputs[0].filepath + '.npz')
     else: # no need to copy empty file
         pass
 copy_data_future = python_app(_copy_data_future, executors=['default'])
@@ -1,3 +1,5 @@
+import os
+os.environ.setdefault('PSIFLOW_TYPECHECK', '1') # enable before importing psiflow
 import pytest
 import parsl
 import requests
@@ -5,7 +7,9 @@ import yaml
 import torch
 import numpy as np
 import tempfile
+import hashlib
 from pathlib import Path
+from filelock import FileLock
 
 from ase import Atoms
 from ase.build import bulk
@@ -48,9 +52,35 @@ def context(parsl_config, tmpdir_factory):
     parsl.clear()
 
 
-@pytest.fixture
-def nequip_config(tmp_path):
-    config_text = requests.get('https://raw.githubusercontent.com/mir-group/nequip/v0.5.5/configs/minimal.yaml').text
+def cached_get(url):
+    """Returns the content at url, cached on disk across test sessions
+
+    Tests are skipped if a file is not cached and cannot be downloaded.
+    Downloads are guarded by a file lock, such that parallel test workers
+    (e.g. pytest-xdist) only download each file once.
+
+    """
+    path_cache = Path(os.environ.get(
+        'PSIFLOW_TEST_CACHE',
+        Path.home() / '.cache' / 'psiflow-tests',
+        ))
+    path_cache.mkdir(parents=True, exist_ok=True)
+    path = path_cache / hashlib.sha1(url.encode()).hexdigest()
+    with FileLock(str(path) + '.lock'):
+        if not path.is_file():
+            try:
+                response = requests.get(url, timeout=60)
+            except requests.exceptions.RequestException as e: # incl. timeouts
+                pytest.skip('unable to download {}: {}'.format(url, e))
+            response.raise_for_status() # never cache error pages
+            with tempfile.NamedTemporaryFile('w', dir=path_cache, delete=False) as f:
+                f.write(response.text)
+            os.replace(f.name, path) # atomic
+    return path.read_text()
+
+
+def get_nequip_config():
+    config_text = cached_get('https://raw.githubusercontent.com/mir-group/nequip/v0.5.5/configs/minimal.yaml')
     config = yaml.load(config_text, Loader=yaml.FullLoader)
     config['r_max'] = 3.5 # reduce computational cost of data processing
     config['chemical_symbols'] = ['X'] # should get overridden
@@ -59,6 +89,11 @@ def nequip_config(tmp_path):
     return config
 
 
+@pytest.fixture
+def nequip_config():
+    return get_nequip_config()
+
+
 def generate_emt_cu_data(nstates, amplitude):
     atoms = bulk('Cu', 'fcc', a=3.6, cubic=True)
     atoms.calc = EMT()
@@ -80,10 +115,38 @@ def generate_emt_cu_data(nstates, amplitude):
     return atoms_list
 
 
-@pytest.fixture
-def dataset(context, tmp_path):
+def generate_dataset(context):
     data = generate_emt_cu_data(20, 0.2)
     data_ = [FlowAtoms.from_atoms(atoms) for atoms in data]
     for atoms in data_:
         atoms.reference_status = True
     return Dataset(context, data_)
+
+
+@pytest.fixture
+def dataset(context, tmp_path):
+    return generate_dataset(context)
+
+
+@pytest.fixture(scope='session')
+def deployed_nequip_model(context):
+    """Initialized and deployed model, shared by tests which do not modify it"""
+    from psiflow.models import NequIPModel
+    model = NequIPModel(context, get_nequip_config())
+    model.initialize(generate_dataset(context)[:3])
+    model.deploy()
+    return model
+
+
+@pytest.fixture(scope='session')
+def trained_nequip_model(context):
+    """Trained and deployed model, shared by tests which do not modify it"""
+    from psiflow.models import NequIPModel
+    dataset = generate_dataset(context)
+    training = dataset[:15]
+    validate = dataset[15:]
+    model = NequIPModel(context, get_nequip_config())
+    model.initialize(training)
+    model.train(training, validate)
+    model.deploy()
+    return model
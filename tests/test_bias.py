@@ -6,7 +6,6 @@ import tempfile
 from ase.build import bulk
 
 from psiflow.data import Dataset
-from psiflow.models import NequIPModel
 from psiflow.sampling import DynamicWalker, RandomWalker, PlumedBias
 from psiflow.sampling.bias import set_path_in_plumed, parse_plumed_input, \
         generate_external_grid
@@ -37,10 +36,8 @@ FLUSH STRIDE=10
     assert parse_plumed_input(plumed_input)[0] == ('METAD', 'CV')
 
 
-def test_dynamic_walker_bias(context, nequip_config, dataset):
-    model = NequIPModel(context, nequip_config)
-    model.initialize(dataset)
-    model.deploy()
+def test_dynamic_walker_bias(context, deployed_nequip_model, dataset):
+    model = deployed_nequip_model
     kwargs = {
             'timestep'           : 1,
             'steps'              : 10,
@@ -7,7 +7,8 @@ from ase import Atoms
 from ase.io import read, write
 from ase.io.extxyz import write_extxyz
 
-from psiflow.data import FlowAtoms, Dataset
+from psiflow.data import FlowAtoms, Dataset, load_dataset_arrays, _DatasetCache, \
+        _states_cache, dataset_to_arrays
 from psiflow.utils import get_index_element_mask
 
 from tests.conftest import generate_emt_cu_data # explicit import for regular function
@@ -159,3 +160,135 @@ def test_dataset_gather(context, dataset):
                 dataset[index].result().positions,
                 gathered[i].result().positions,
                 )
+
+
+def test_dataset_metric_values(context, dataset):
+    data = dataset.as_list()
+    errors_rmse = Dataset.get_errors(dataset, None, elements=['Cu'], properties=['forces'])
+    errors_mae  = Dataset.get_errors(dataset, None, elements=['Cu'], properties=['forces'], metric='mae')
+    errors_max  = Dataset.get_errors(dataset, None, elements=['Cu'], properties=['forces'], metric='max')
+    for i, atoms in enumerate(data):
+        forces = 1000 * atoms.arrays['forces'][atoms.numbers == 29]
+        norms = np.linalg.norm(forces, axis=1)
+        assert np.allclose(errors_rmse.result()[i, 0], np.mean(norms))
+        assert np.allclose(errors_mae.result()[i, 0], np.mean(np.abs(forces)))
+        assert np.allclose(errors_max.result()[i, 0], np.max(norms))
+    errors = Dataset.get_errors(dataset, None, properties=['energy'])
+    energies = np.array([1000 * a.info['energy'] / len(a) for a in data])
+    assert np.allclose(errors.result()[:, 0], np.abs(energies))
+
+
+def test_dataset_arrays(context, dataset, tmp_path):
+    path_xyz = tmp_path / 'data.xyz'
+    dataset.save(path_xyz)
+    assert not os.path.isfile(str(path_xyz) + '.npz') # only .xyz is saved
+    data = dataset.as_list()
+    arrays = load_dataset_arrays(path_xyz)
+    assert np.array_equal(arrays['natoms'], [len(a) for a in data])
+    assert np.allclose(arrays['positions'], np.concatenate([a.positions for a in data]))
+    assert np.allclose(arrays['energy'], [a.info['energy'] for a in data])
+    assert np.all(arrays['reference_status'])
+
+    data = generate_emt_cu_data(5, 0.1) # overwrite without updating sidecar
+    with open(path_xyz, 'w') as f:
+        write_extxyz(f, data)
+    arrays = load_dataset_arrays(path_xyz)
+    assert len(arrays['natoms']) == 5
+    assert np.allclose(arrays['positions'], np.concatenate([a.positions for a in data]))
+
+
+def test_dataset_headers(context, dataset, tmp_path):
+    path_xyz = tmp_path / 'data.xyz'
+    data = dataset.as_list()
+    data[3].reference_status = False
+    with open(path_xyz, 'w') as f: # no sidecar
+        write_extxyz(f, data)
+    dataset_ = Dataset.load(context, path_xyz)
+    assert dataset_.length().result() == len(data)
+    assert dataset_.failed.result() == [3]
+    assert len(dataset_.success.result()) == len(data) - 1
+
+
+def test_dataset_gather_negative(context, dataset):
+    gathered = dataset[[-1, 0, -1]]
+    assert gathered.length().result() == 3
+    last = dataset[dataset.length().result() - 1].result()
+    assert np.allclose(gathered[0].result().positions, last.positions)
+    assert np.allclose(gathered[2].result().positions, last.positions)
+    assert np.allclose(gathered[1].result().positions, dataset[0].result().positions)
+
+
+def test_dataset_metric_verify(context, dataset):
+    data = [FlowAtoms.from_atoms(a) for a in generate_emt_cu_data(20, 0.2)]
+    other = Dataset(context, data) # same number of atoms, other positions
+    errors = Dataset.get_errors(dataset, other)
+    assert errors.result().shape == (20, 3)
+    with pytest.raises(AssertionError):
+        errors = Dataset.get_errors(dataset, other, verify=True)
+        errors.result()
+
+
+def test_dataset_copy(context, dataset):
+    part = dataset[:5]
+    assert Dataset(context, None, data_future=part.data_future).data_future is part.data_future
+    copied = part.copy()
+    assert copied.data_future.filepath != part.data_future.filepath
+    assert copied.length().result() == 5
+
+
+def test_dataset_cache(tmp_path):
+    paths = []
+    for i in range(3):
+        paths.append(tmp_path / 'data_{}.xyz'.format(i))
+        with open(paths[-1], 'w') as f:
+            write_extxyz(f, generate_emt_cu_data(5, 0.1)) # 20 atoms per file
+    nloads = []
+    def load(path_xyz):
+        nloads.append(path_xyz)
+        return read(path_xyz, index=':')
+    count_atoms = lambda states: sum(len(atoms) for atoms in states)
+    cache = _DatasetCache(max_atoms=50) # budget for two of the three files
+    for path in paths:
+        cache.get(path, load, count_atoms)
+    assert cache.natoms == 40
+    cache.get(paths[2], load, count_atoms)
+    cache.get(paths[1], load, count_atoms)
+    assert len(nloads) == 3 # most recent files are cached
+    cache.get(paths[0], load, count_atoms) # evicted first
+    assert len(nloads) == 4
+    assert cache.natoms == 40
+
+    cache = _DatasetCache(max_atoms=10) # smaller than any single file
+    cache.get(paths[0], load, count_atoms)
+    cache.get(paths[0], load, count_atoms)
+    assert cache.natoms == 0
+    assert len(nloads) == 6
+
+
+def test_dataset_cache_default(context, monkeypatch):
+    # apps on the 'default' label may run in the driver (e.g. threadpool),
+    # in which case they populate the caches of this process
+    monkeypatch.setattr(_states_cache, 'max_atoms', 40)
+    _states_cache.clear()
+    for i in range(5):
+        data = [FlowAtoms.from_atoms(a) for a in generate_emt_cu_data(5, 0.1)]
+        dataset = Dataset(context, data) # 20 atoms
+        assert dataset.length().result() == 5
+        assert len(dataset.as_list()) == 5
+        assert _states_cache.natoms <= 40
+    _states_cache.clear()
+
+
+def test_dataset_arrays_stress(context, dataset):
+    data = dataset.as_list()
+    voigt = data[0].info['stress'][[0, 1, 2, 1, 0, 0], [0, 1, 2, 2, 2, 1]]
+    data[0].info['stress'] = voigt
+    dataset_ = Dataset(context, data)
+    errors = Dataset.get_errors(dataset_, dataset)
+    assert np.allclose(errors.result(), 0) # voigt stress converted to 3x3
+
+    data[1].info['stress'] = np.zeros(4) # cannot be interpreted as a stress
+    arrays = dataset_to_arrays(data)
+    assert arrays['has_stress'][0]
+    assert not arrays['has_stress'][1]
+    assert np.all(arrays['has_energy']) and np.all(arrays['has_forces'])
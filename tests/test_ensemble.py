@@ -21,18 +21,17 @@ def test_ensemble_sampling(context, dataset, tmp_path):
     assert new_data.length().result() == nstates
 
     # no two states should be the same
-    for i in range(new_data.length().result() - 1):
-        for j in range(i + 1, new_data.length().result()):
-            assert not np.allclose(
-                    new_data[i].result().get_positions(),
-                    new_data[j].result().get_positions(),
-                    )
+    positions = np.stack([a.get_positions() for a in new_data.as_list()])
+    for i in range(nstates - 1):
+        for j in range(i + 1, nstates):
+            assert not np.allclose(positions[i], positions[j])
 
     # test save and load
     ensemble.save(tmp_path)
     ensemble_ = Ensemble.load(context, tmp_path)
     assert ensemble_.nwalkers == nwalkers
-    ndirs = len([f for f in os.listdir(tmp_path) if os.path.isdir(tmp_path / f)])
+    with os.scandir(tmp_path) as entries: # is_dir() requires no extra stat
+        ndirs = sum(1 for entry in entries if entry.is_dir())
     assert ndirs == nwalkers
 
     ensemble.walkers[3].tag_unsafe()
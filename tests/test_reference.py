@@ -1,6 +1,8 @@
 import requests
 import pytest
 import os
+from concurrent.futures import wait
+from copy import deepcopy
 import molmod
 import numpy as np
 from parsl.dataflow.futures import AppFuture
@@ -14,12 +16,28 @@ from ase.io.extxyz import write_extxyz
 from psiflow.data import FlowAtoms, parse_reference_logs
 from psiflow.reference import EMTReference, CP2KReference
 from psiflow.reference._cp2k import insert_filepaths_in_input, \
-        insert_atoms_in_input
+        get_cp2k_template, render_atoms, \
+        sentinel_filepath, SENTINEL_ATOMS, parse_cp2k_output, \
+        get_cp2k_data_dir, fill_sentinels, CP2KParameters
 from psiflow.data import Dataset
-from psiflow.execution import ReferenceExecutionDefinition
+from psiflow.execution import ExecutionContext, ReferenceExecutionDefinition
 
+from tests.conftest import cached_get
 
-@pytest.fixture
+
+# CP2K results for the H2 molecule in test_cp2k_success, in eV, eV/A and MPa
+ENERGY_REFERENCE = -1.165271084838365 / molmod.units.electronvolt
+FORCES_REFERENCE = np.array([
+        [0.01218794, 0.00001251, 0.00001251],
+        [-0.01215503, 0.00001282, 0.00001282],
+        ]) * (molmod.units.angstrom / molmod.units.electronvolt)
+STRESS_REFERENCE = 1000 * np.array([
+        [4.81790309081E-01,   7.70485237955E-05,   7.70485237963E-05],
+        [7.70485237955E-05,  -9.50069820373E-03,   1.61663002757E-04],
+        [7.70485237963E-05,   1.61663002757E-04,  -9.50069820373E-03],
+        ])
+
+@pytest.fixture(scope='session')
 def fake_cp2k_input():
     return  """
 &FORCE_EVAL
@@ -52,11 +70,26 @@ def fake_cp2k_input():
 """
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
+def fake_cp2k_input_parsed(fake_cp2k_input):
+    return Cp2kInput.from_string(fake_cp2k_input) # deepcopy before modifying
+
+
+@pytest.fixture(scope='session')
+def h2_atoms():
+    return FlowAtoms( # simple H2 at ~optimized interatomic distance
+            numbers=np.ones(2, dtype=int),
+            cell=5 * np.eye(3),
+            positions=np.array([[0, 0, 0], [0.74, 0, 0]]),
+            pbc=True,
+            )
+
+
+@pytest.fixture(scope='session') # download only once
 def cp2k_data():
-    basis     = requests.get('https://raw.githubusercontent.com/cp2k/cp2k/v9.1.0/data/BASIS_MOLOPT_UZH').text
-    dftd3     = requests.get('https://raw.githubusercontent.com/cp2k/cp2k/v9.1.0/data/dftd3.dat').text
-    potential = requests.get('https://raw.githubusercontent.com/cp2k/cp2k/v9.1.0/data/POTENTIAL_UZH').text
+    basis     = cached_get('https://raw.githubusercontent.com/cp2k/cp2k/v9.1.0/data/BASIS_MOLOPT_UZH')
+    dftd3     = cached_get('https://raw.githubusercontent.com/cp2k/cp2k/v9.1.0/data/dftd3.dat')
+    potential = cached_get('https://raw.githubusercontent.com/cp2k/cp2k/v9.1.0/data/POTENTIAL_UZH')
     return {
             'BASIS_SET_FILE_NAME': basis,
             'POTENTIAL_FILE_NAME': potential,
@@ -136,17 +169,25 @@ def cp2k_input():
 def test_reference_emt(context, dataset, tmp_path):
     reference = EMTReference(context)
     # modify dataset to include states for which EMT fails:
-    _ = reference.evaluate(dataset).as_list()
-    assert reference.data_failed.length().result() == 0
-    assert len(reference.logs.result()) == 0
+    reference.evaluate(dataset).data_future.result() # no need to read states
+    futures = [reference.data_failed.length(), reference.logs]
+    wait(futures) # resolve independent futures concurrently
+    assert futures[0].result() == 0
+    assert len(futures[1].result()) == 0
     atoms_list = dataset.as_list()
     atoms_list[6].numbers[1] = 90
     atoms_list[9].numbers[1] = 3
     dataset_ = Dataset(context, atoms_list)
     evaluated = reference.evaluate(dataset_)
-    assert evaluated.length().result() == len(atoms_list)
-    assert len(reference.logs.result()) == 2 # after join app execution
-    assert reference.data_failed.length().result() == 2
+    futures = [
+            evaluated.length(),
+            reference.logs, # after join app execution
+            reference.data_failed.length(),
+            ]
+    wait(futures)
+    assert futures[0].result() == len(atoms_list)
+    assert len(futures[1].result()) == 2
+    assert futures[2].result() == 2
 
     atoms = reference.evaluate(dataset_[5]).result()
     assert type(atoms) == FlowAtoms
@@ -158,7 +199,7 @@ def test_reference_emt(context, dataset, tmp_path):
     assert atoms.reference_log != reference.logs.result()[1]
 
 
-def test_cp2k_insert_filepaths(fake_cp2k_input):
+def test_cp2k_insert_filepaths(fake_cp2k_input_parsed):
     filepaths = {
             'BASIS_SET_FILE_NAME': ['basisset0', 'basisset1'],
             'POTENTIAL_FILE_NAME': 'potential',
@@ -195,27 +236,106 @@ def test_cp2k_insert_filepaths(fake_cp2k_input):
 &END FORCE_EVAL
 """
     target = Cp2kInput.from_string(target_input)
-    sample = Cp2kInput.from_string(insert_filepaths_in_input(fake_cp2k_input, filepaths))
+    sample = insert_filepaths_in_input(deepcopy(fake_cp2k_input_parsed), filepaths)
     assert str(target) == str(sample)
 
 
-def test_cp2k_insert_atoms(tmp_path, fake_cp2k_input):
+def test_cp2k_template(fake_cp2k_input):
+    keys = ('BASIS_SET_FILE_NAME', 'POTENTIAL_FILE_NAME')
+    template = get_cp2k_template(fake_cp2k_input, keys)
+    assert SENTINEL_ATOMS in template
     atoms = FlowAtoms(numbers=np.ones(3), cell=np.eye(3), positions=np.eye(3), pbc=True)
-    sample = Cp2kInput.from_string(insert_atoms_in_input(fake_cp2k_input, atoms))
-    assert 'COORD' in sample['FORCE_EVAL']['SUBSYS'].subsections.keys()
-    assert 'CELL' in sample['FORCE_EVAL']['SUBSYS'].subsections.keys()
+    cp2k_input = template.replace(SENTINEL_ATOMS, render_atoms(atoms))
+    for key in keys:
+        assert sentinel_filepath(key) in cp2k_input
+        cp2k_input = cp2k_input.replace(sentinel_filepath(key), 'path_' + key)
+    sample = Cp2kInput.from_string(cp2k_input)
     natoms = len(sample['FORCE_EVAL']['SUBSYS']['COORD'].keywords['H'])
-    assert natoms == 3
+    assert natoms == 3 # original COORD section is replaced
+    assert 'CELL' in sample['FORCE_EVAL']['SUBSYS'].subsections.keys()
+    assert 'path_BASIS_SET_FILE_NAME' in str(sample)
 
+    substitutions = {sentinel_filepath(key): 'path_' + key for key in keys}
+    substitutions[SENTINEL_ATOMS] = render_atoms(atoms)
+    assert fill_sentinels(template, substitutions) == cp2k_input
 
-def test_cp2k_success(context, cp2k_input, cp2k_data):
-    reference = CP2KReference(context, cp2k_input=cp2k_input, cp2k_data=cp2k_data)
-    atoms = FlowAtoms( # simple H2 at ~optimized interatomic distance
-            numbers=np.ones(2),
-            cell=5 * np.eye(3),
-            positions=np.array([[0, 0, 0], [0.74, 0, 0]]),
-            pbc=True,
+
+def test_cp2k_data_dir():
+    cp2k_data = {'BASIS_SET_FILE_NAME': 'basis', 'POTENTIAL_FILE_NAME': 'pot'}
+    parameters = CP2KParameters(cp2k_input='', cp2k_data=cp2k_data)
+    path_data = get_cp2k_data_dir(parameters)
+    assert path_data.parent.name == 'psiflow_cp2k_data_{}'.format(os.getpid())
+    assert (path_data / 'BASIS_SET_FILE_NAME').read_text() == 'basis'
+    assert (path_data / 'POTENTIAL_FILE_NAME').read_text() == 'pot'
+    parameters_ = CP2KParameters(cp2k_input='', cp2k_data=dict(cp2k_data))
+    assert get_cp2k_data_dir(parameters_) == path_data # same content
+    cp2k_data = dict(cp2k_data, POTENTIAL_FILE_NAME='other pot')
+    parameters_ = CP2KParameters(cp2k_input='', cp2k_data=cp2k_data)
+    assert get_cp2k_data_dir(parameters_) != path_data
+    assert get_cp2k_data_dir(parameters_).parent == path_data.parent
+
+
+def test_cp2k_parse_output(tmp_path):
+    # excerpt of a CP2K v9.1 output
+    output = '''
+ ENERGY| Total FORCE_EVAL ( QS ) energy [a.u.]:               -1.165271084838365
+
+
+ ATOMIC FORCES in [a.u.]
+
+ # Atom   Kind   Element          X              Y              Z
+      1      1      H           0.01218794     0.00001251     0.00001251
+      2      1      H          -0.01215503     0.00001282     0.00001282
+ SUM OF ATOMIC FORCES           0.00003291     0.00002533     0.00002533     0.00004857
+
+ STRESS| Analytical stress tensor [GPa]
+ STRESS|                        x                   y                   z
+ STRESS|      x        4.81790309081E-01   7.70485237955E-05   7.70485237963E-05
+ STRESS|      y        7.70485237955E-05  -9.50069820373E-03   1.61663002757E-04
+ STRESS|      z        7.70485237963E-05   1.61663002757E-04  -9.50069820373E-03
+ STRESS| 1/3 Trace                                                 1.54263210418E-01
+ STRESS| Determinant                                              -4.34752156836E-05
+
+ STRESS| Eigenvectors and eigenvalues of the analytical stress tensor [GPa]
+ STRESS|                        1                   2                   3
+ STRESS| Eigenvalues     -9.66236163426E-03  -9.33903477320E-03   4.81790333869E-01
+ STRESS|      x           1.847418E-05        1.562953E-04        9.999999E-01
+ STRESS|      y          -7.071067E-01        7.071068E-01       -9.745570E-05
+ STRESS|      z           7.071068E-01        7.071067E-01       -1.236958E-04
+'''
+    path_output = tmp_path / 'cp2k_output.txt'
+    path_output.write_text(output)
+    energy, forces, stress = parse_cp2k_output(path_output)
+    assert energy == -1.165271084838365
+    assert forces.shape == (2, 3)
+    assert np.allclose(forces[1], [-0.01215503, 0.00001282, 0.00001282])
+    assert stress.shape == (3, 3)
+    assert np.allclose(stress, stress.T)
+    assert stress[0, 0] == 4.81790309081E-01
+
+    legacy = output.split(' STRESS|')[0] + '''
+ STRESS TENSOR [GPa]
+
+                        X               Y               Z
+  X       4.81790309081E-01   7.70485237955E-05   7.70485237963E-05
+  Y       7.70485237955E-05  -9.50069820373E-03   1.61663002757E-04
+  Z       7.70485237963E-05   1.61663002757E-04  -9.50069820373E-03
+''' # CP2K < 7
+    path_output.write_text(legacy)
+    assert np.allclose(parse_cp2k_output(path_output)[2], stress)
+
+    path_output.write_text('no results')
+    assert parse_cp2k_output(path_output) == (None, None, None)
+
+
+def test_cp2k_success(context, cp2k_input, cp2k_data, h2_atoms):
+    reference = CP2KReference(
+            context,
+            cp2k_input=cp2k_input,
+            cp2k_data=cp2k_data,
+            keep_log=True, # used to verify the number of processes
             )
+    atoms = h2_atoms.copy() # singlepoints may modify their input
     dataset = Dataset(context, [atoms])
     evaluated = reference.evaluate(dataset[0])
     assert isinstance(evaluated, AppFuture)
@@ -224,37 +344,29 @@ def test_cp2k_success(context, cp2k_input, cp2k_data):
     assert 'energy' in evaluated.result().info.keys()
     assert 'stress' in evaluated.result().info.keys()
     assert 'forces' in evaluated.result().arrays.keys()
-    assert np.allclose(
-            -1.165271084838365 / molmod.units.electronvolt,
-            evaluated.result().info['energy'],
-            )
-    forces_reference = np.array([[0.01218794, 0.00001251, 0.00001251],
-            [-0.01215503, 0.00001282, 0.00001282]])
-    forces_reference /= molmod.units.electronvolt
-    forces_reference *= molmod.units.angstrom
-    assert np.allclose(forces_reference, evaluated.result().arrays['forces'])
-    stress_reference = np.array([
-             [4.81790309081E-01,   7.70485237955E-05,   7.70485237963E-05],
-             [7.70485237955E-05,  -9.50069820373E-03,   1.61663002757E-04],
-             [7.70485237963E-05,   1.61663002757E-04,  -9.50069820373E-03]])
-    stress_reference *= 1000
-    assert np.allclose(stress_reference, evaluated.result().info['stress'])
+    assert np.allclose(ENERGY_REFERENCE, evaluated.result().info['energy'])
+    assert np.allclose(FORCES_REFERENCE, evaluated.result().arrays['forces'])
+    assert np.allclose(STRESS_REFERENCE, evaluated.result().info['stress'])
 
     # check number of mpi processes
     content = evaluated.result().reference_log
     ncores = context[ReferenceExecutionDefinition].ncores
-    lines = content.split('\n')
-    for line in lines:
-        if 'Total number of message passing processes' in line:
+    nprocesses, nthreads = None, None
+    for line in content.splitlines():
+        line = line.lstrip()
+        if line.startswith('GLOBAL|'): # e.g. ' GLOBAL| Number of threads ...'
+            line = line[len('GLOBAL|'):].lstrip()
+        if line.startswith('Total number of message passing processes'):
             nprocesses = int(line.split()[-1])
-        #print(line)
-        if 'Number of threads for this process' in line:
+        elif line.startswith('Number of threads for this process'):
             nthreads = int(line.split()[-1])
+        if (nprocesses is not None) and (nthreads is not None):
+            break # both are printed in the header of the output
     assert nprocesses == ncores
     assert nthreads == 1 # hardcoded into app
 
 
-def test_cp2k_failure(context, cp2k_data):
+def test_cp2k_failure(context, cp2k_data, h2_atoms):
     cp2k_input = """
 &FORCE_EVAL
    METHOD Quickstep
@@ -321,12 +433,7 @@ def test_cp2k_failure(context, cp2k_data):
 &END FORCE_EVAL
 """ # incorrect input file
     reference = CP2KReference(context, cp2k_input=cp2k_input, cp2k_data=cp2k_data)
-    atoms = FlowAtoms( # simple H2 at ~optimized interatomic distance
-            numbers=np.ones(2),
-            cell=5 * np.eye(3),
-            positions=np.array([[0, 0, 0], [0.74, 0, 0]]),
-            pbc=True,
-            )
+    atoms = h2_atoms.copy() # singlepoints may modify their input
     evaluated = reference.evaluate(atoms)
     assert isinstance(evaluated, AppFuture)
     assert evaluated.result().reference_status == False
@@ -353,3 +460,40 @@ def test_cp2k_timeout(context, cp2k_data, cp2k_input):
     assert isinstance(evaluated, AppFuture)
     assert evaluated.result().reference_status == False
     assert 'energy' not in evaluated.result().info.keys()
+
+
+def test_cp2k_batch(context, cp2k_input, cp2k_data, h2_atoms, tmp_path):
+    context_batch = ExecutionContext(context.config, path=tmp_path / 'context')
+    context_batch.register(ReferenceExecutionDefinition(
+        time_per_singlepoint=context[ReferenceExecutionDefinition].time_per_singlepoint,
+        singlepoints_per_task=2,
+        ))
+    stretched = h2_atoms.copy()
+    stretched.positions[1, 0] = 0.8
+    failed = h2_atoms.copy() # no KIND section for He; fails immediately
+    failed.numbers[1] = 2
+    states = [h2_atoms.copy(), failed, stretched] # last batch is incomplete
+
+    reference = CP2KReference(context, cp2k_input=cp2k_input, cp2k_data=cp2k_data)
+    evaluated = reference.evaluate(Dataset(context, states))
+    reference_batch = CP2KReference(
+            context_batch,
+            cp2k_input=cp2k_input,
+            cp2k_data=cp2k_data,
+            )
+    evaluated_batch = reference_batch.evaluate(Dataset(context_batch, states))
+    data = evaluated.as_list()
+    data_batch = evaluated_batch.as_list()
+    assert len(data) == len(data_batch) == len(states)
+    assert [a.reference_status for a in data_batch] == [True, False, True]
+    for atoms, atoms_batch, state in zip(data, data_batch, states):
+        assert np.array_equal(atoms_batch.numbers, state.numbers) # same order
+        assert np.allclose(atoms_batch.positions, state.positions)
+        assert atoms_batch.reference_status == atoms.reference_status
+        if atoms.reference_status:
+            assert np.allclose(atoms_batch.info['energy'], atoms.info['energy'])
+            assert np.allclose(atoms_batch.arrays['forces'], atoms.arrays['forces'])
+    assert np.allclose(data_batch[0].info['energy'], ENERGY_REFERENCE)
+    assert 'energy' not in data_batch[1].info.keys()
+    assert reference_batch.data_failed.length().result() == 1
+    assert len(reference_batch.logs.result()) == 1
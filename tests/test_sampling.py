@@ -7,7 +7,6 @@ from parsl.dataflow.futures import AppFuture
 
 from ase import Atoms
 
-from psiflow.models import NequIPModel
 from psiflow.sampling import BaseWalker, RandomWalker, DynamicWalker, \
         OptimizationWalker, load_walker
 from psiflow.ensemble import Ensemble
@@ -25,14 +24,11 @@ def test_save_load(context, dataset, tmp_path):
     assert os.path.exists(path_pars)
     walker_ = load_walker(context, tmp_path)
     assert type(walker_) == DynamicWalker
-    assert np.allclose(
-            walker.start_future.result().positions,
-            walker_.start_future.result().positions,
-            )
-    assert np.allclose(
-            walker.state_future.result().positions,
-            walker_.state_future.result().positions,
-            )
+    # not bitwise identical; .xyz files store positions with eight decimals
+    diff = walker.start_future.result().positions - walker_.start_future.result().positions
+    assert np.abs(diff).max() < 1e-6
+    diff = walker.state_future.result().positions - walker_.state_future.result().positions
+    assert np.abs(diff).max() < 1e-6
     for key, value in asdict(walker.parameters).items():
         assert value == asdict(walker_.parameters)[key]
 
@@ -77,22 +73,17 @@ def test_random_walker(context, dataset):
     state = walker.propagate(model='dummy') # irrelevant kwargs are ignored
 
 
-def test_dynamic_walker(context, dataset, nequip_config):
+def test_dynamic_walker(context, dataset, deployed_nequip_model):
     walker = DynamicWalker(context, dataset[0], steps=10, step=1)
-    model = NequIPModel(context, nequip_config)
-    model.initialize(dataset[:3])
-    model.deploy()
+    model = deployed_nequip_model
     state, trajectory = walker.propagate(model=model, keep_trajectory=True)
-    assert trajectory.length().result() == 11
-    assert np.allclose(
-            trajectory[0].result().get_positions(), # initial structure
-            walker.start_future.result().get_positions(),
-            )
+    positions = np.stack([a.get_positions() for a in trajectory.as_list()])
+    start = walker.start_future.result().get_positions()
+    assert positions.shape[0] == 11
+    assert np.abs(positions[0] - start).max() < 1e-6 # initial structure
     assert walker.tag_future.result() == 'safe'
-    assert not np.allclose(
-            walker.start_future.result().get_positions(),
-            state.result().get_positions(),
-            )
+    assert np.abs(start - state.result().get_positions()).max() > 1e-6
+    assert np.abs(positions[-1] - state.result().get_positions()).max() < 1e-6
     walker.parameters.force_threshold = 0.001
     walker.parameters.steps           = 1
     walker.parameters.step            = 1
@@ -100,14 +91,8 @@ def test_dynamic_walker(context, dataset, nequip_config):
     assert walker.tag_future.result() == 'unsafe' # raised ForceExceededException
 
 
-def test_optimization(context, dataset, nequip_config):
-    training = dataset[:15]
-    validate = dataset[15:]
-    model = NequIPModel(context, nequip_config)
-    model.initialize(training)
-    model.train(training, validate)
-    model.deploy()
-
+def test_optimization(context, dataset, trained_nequip_model):
+    model = trained_nequip_model
     walker = OptimizationWalker(context, dataset[0], optimize_cell=False, fmax=1e-1)
     final = walker.propagate(model=model)
     assert np.all(np.abs(final.result().positions - dataset[0].result().positions) < 0.5)